@@ -0,0 +1,321 @@
+# assets.py
+# Static asset pipeline: fingerprinted copies of everything under static/,
+# gzip/brotli siblings for text files and optimized/WebP image variants,
+# all under static/dist and listed in manifest.json. AssetFiles serves them
+# with immutable cache headers and picks the smallest variant the client
+# accepts; asset_url() is the template helper that rewrites asset paths.
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import re
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import anyio
+from fastapi.staticfiles import StaticFiles
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:  # optional: images are fingerprinted but not re-encoded
+    Image = None
+
+STATIC_DIR = os.environ.get("STATIC_DIR", "static")
+DIST_NAME = "dist"
+URL_PREFIX = "/static/"
+# Rebuild on startup when a source file changed since the last build (one worker builds, under a lock)
+ASSETS_AUTOBUILD = os.environ.get("ASSETS_AUTOBUILD", "1") == "1"
+WEBP_QUALITY = int(os.environ.get("ASSETS_WEBP_QUALITY", "82"))
+
+TEXT_SUFFIXES = (".css", ".js", ".svg", ".json", ".txt", ".html", ".map")
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg")
+# Precompressed files smaller than this are not worth the extra file
+MIN_COMPRESS_BYTES = 512
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)(/static/[^'")?#]+)([^'")]*)\1\s*\)""")
+
+_manifest: Dict[str, str] = {}
+_variants: Dict[str, List[str]] = {}
+_loaded = {"version": ""}
+_lock = threading.Lock()
+
+
+def _dist_dir(static_dir: str) -> str:
+    return os.path.join(static_dir, DIST_NAME)
+
+
+def _manifest_path(static_dir: str) -> str:
+    return os.path.join(_dist_dir(static_dir), "manifest.json")
+
+
+@contextmanager
+def _build_lock(static_dir: str):
+    """Serialize builds between worker processes on this host (no-op where fcntl is unavailable)."""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    # Outside dist/, which build() cleans; dotfiles are not treated as assets
+    with open(os.path.join(static_dir, ".dist.lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_manifest(static_dir: str) -> Optional[dict]:
+    try:
+        with open(_manifest_path(static_dir)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _sources(static_dir: str) -> List[str]:
+    out = []
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.abspath(root) == os.path.abspath(static_dir):
+            dirs[:] = [d for d in dirs if d != DIST_NAME]
+        dirs.sort()
+        for name in sorted(files):
+            if not name.startswith("."):
+                out.append(os.path.relpath(os.path.join(root, name), static_dir).replace(os.sep, "/"))
+    return out
+
+
+def source_version(static_dir: str = STATIC_DIR) -> str:
+    """Cheap fingerprint of the source tree (paths, sizes, mtimes) to detect stale builds."""
+    h = hashlib.sha1()
+    for rel in _sources(static_dir):
+        st = os.stat(os.path.join(static_dir, rel))
+        h.update(f"{rel}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return h.hexdigest()
+
+
+def _hashed_name(rel: str, content: bytes) -> str:
+    base, ext = os.path.splitext(rel)
+    return f"{base}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+
+def _write(path: str, content: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def _rewrite_css(content: bytes, files: Dict[str, str]) -> bytes:
+    # Point url(/static/...) references at their fingerprinted copies
+    def sub(match):
+        quote, path, suffix = match.groups()
+        hashed = files.get(path[len(URL_PREFIX):])
+        return f"url({quote}{URL_PREFIX}{DIST_NAME}/{hashed}{suffix}{quote})" if hashed else match.group(0)
+
+    return _CSS_URL.sub(sub, content.decode("utf-8")).encode("utf-8")
+
+
+def _compressed(content: bytes) -> Dict[str, bytes]:
+    out = {"gz": gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        out["br"] = brotli.compress(content, quality=11)
+    return {ext: data for ext, data in out.items() if len(data) < len(content)}
+
+
+def _image_variants(content: bytes, suffix: str) -> Dict[str, bytes]:
+    """Losslessly re-optimized original (same format) and a WebP copy, each kept only if smaller."""
+    if Image is None:
+        return {}
+    out = {}
+    with Image.open(io.BytesIO(content)) as img:
+        img.load()
+        fmt = "PNG" if suffix == ".png" else "JPEG"
+        buf = io.BytesIO()
+        img.save(buf, fmt, optimize=True, **({"quality": 85, "progressive": True} if fmt == "JPEG" else {}))
+        if buf.tell() < len(content):
+            out[""] = buf.getvalue()
+        buf = io.BytesIO()
+        img.save(buf, "WEBP", quality=WEBP_QUALITY, method=6)
+        if buf.tell() < len(out.get("", content)):
+            out["webp"] = buf.getvalue()
+    return out
+
+
+def build(static_dir: str = STATIC_DIR) -> dict:
+    """
+    Fingerprint and precompress every file under static_dir into its dist
+    folder and write manifest.json last, so a reader never sees a manifest
+    pointing at files that are not there yet. Stale outputs are removed.
+    """
+    dist = _dist_dir(static_dir)
+    version = source_version(static_dir)
+    sources = _sources(static_dir)
+    # CSS can reference other assets, so fingerprint everything else first
+    sources.sort(key=lambda rel: rel.endswith(".css"))
+    files: Dict[str, str] = {}
+    variants: Dict[str, List[str]] = {}
+    written = set()
+    for rel in sources:
+        with open(os.path.join(static_dir, rel), "rb") as f:
+            content = f.read()
+        suffix = os.path.splitext(rel)[1].lower()
+        if suffix == ".css":
+            content = _rewrite_css(content, files)
+        extra: Dict[str, bytes] = {}
+        if suffix in TEXT_SUFFIXES and len(content) >= MIN_COMPRESS_BYTES:
+            extra = _compressed(content)
+        elif suffix in IMAGE_SUFFIXES:
+            try:
+                extra = _image_variants(content, suffix)
+            except Exception as e:
+                print(f"Asset Image Error ({rel}): {e}")
+            content = extra.pop("", content)
+        hashed = _hashed_name(rel, content)
+        files[rel] = hashed
+        target = os.path.join(dist, hashed)
+        if not os.path.exists(target):
+            _write(target, content)
+        written.add(os.path.abspath(target))
+        for ext, data in extra.items():
+            _write(f"{target}.{ext}", data)
+            written.add(os.path.abspath(f"{target}.{ext}"))
+        if extra:
+            variants[hashed] = sorted(extra)
+    manifest = {"version": version, "files": files, "variants": variants}
+    _write(_manifest_path(static_dir), json.dumps(manifest, indent=1, sort_keys=True).encode())
+    written.add(os.path.abspath(_manifest_path(static_dir)))
+    for root, _, names in os.walk(dist):
+        for name in names:
+            path = os.path.abspath(os.path.join(root, name))
+            if path not in written:
+                os.remove(path)
+    return manifest
+
+
+def load(static_dir: str = STATIC_DIR, rebuild: bool = ASSETS_AUTOBUILD) -> int:
+    """
+    Load the manifest, rebuilding first if it is missing or out of date.
+    Workers starting together take the build lock in turn: the first one
+    builds, the rest find a current manifest and only read it. Returns
+    files mapped.
+    """
+    manifest = _read_manifest(static_dir)
+    if rebuild and (manifest is None or manifest.get("version") != source_version(static_dir)):
+        try:
+            with _build_lock(static_dir):
+                manifest = _read_manifest(static_dir)
+                if manifest is None or manifest.get("version") != source_version(static_dir):
+                    manifest = build(static_dir)
+        except Exception as e:
+            print(f"Asset Build Error: {e}")
+    with _lock:
+        _manifest.clear()
+        _variants.clear()
+        if manifest:
+            _manifest.update(manifest.get("files", {}))
+            _variants.update(manifest.get("variants", {}))
+        _loaded["version"] = manifest.get("version", "") if manifest else ""
+    return len(_manifest)
+
+
+def version() -> str:
+    """Version of the loaded manifest; changes whenever asset_url() results may change."""
+    return _loaded["version"]
+
+
+def asset_url(path: str) -> str:
+    """Template helper: 'css/login.css' or '/static/css/login.css' -> fingerprinted URL, or the plain one if unbuilt."""
+    rel = path[len(URL_PREFIX):] if path.startswith(URL_PREFIX) else path.lstrip("/")
+    hashed = _manifest.get(rel)
+    return f"{URL_PREFIX}{DIST_NAME}/{hashed}" if hashed else f"{URL_PREFIX}{rel}"
+
+
+def _accepts(header: str, token: str) -> bool:
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == token:
+            return params.replace(" ", "").lower() not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+class AssetFiles(StaticFiles):
+    """
+    StaticFiles that serves fingerprinted files under dist/ as immutable,
+    swapping in a precompressed or WebP sibling when the client accepts it.
+    Everything else is served with no-cache so browsers revalidate via ETag.
+    """
+
+    async def get_response(self, path: str, scope) -> Response:
+        rel = path.replace(os.sep, "/")
+        if not rel.startswith(DIST_NAME + "/"):
+            response = await super().get_response(path, scope)
+            response.headers.setdefault("cache-control", REVALIDATE)
+            return response
+        hashed = rel[len(DIST_NAME) + 1:]
+        available = _variants.get(hashed, ())
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        choice, vary = None, None
+        if "webp" in available:
+            vary = "Accept"
+            if "image/webp" in headers.get("accept", ""):
+                choice = "webp"
+        else:
+            if available:
+                vary = "Accept-Encoding"
+            encodings = headers.get("accept-encoding", "")
+            choice = next((ext for ext, token in (("br", "br"), ("gz", "gzip"))
+                           if ext in available and _accepts(encodings, token)), None)
+        response = None
+        if choice:
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, f"{path}.{choice}")
+            if stat_result is not None:
+                response = self.file_response(full_path, stat_result, scope)
+                if choice == "webp":
+                    response.headers["content-type"] = "image/webp"
+                else:
+                    response.headers["content-encoding"] = "br" if choice == "br" else "gzip"
+                    media_type = mimetypes.guess_type(hashed)[0] or "application/octet-stream"
+                    if media_type.startswith("text/") or media_type in ("application/javascript", "image/svg+xml"):
+                        media_type += "; charset=utf-8"
+                    response.headers["content-type"] = media_type
+        if response is None:
+            response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            response.headers["cache-control"] = IMMUTABLE
+            if vary:
+                response.headers["vary"] = vary
+        return response
+
+    def stats(self) -> dict:
+        return {"files": len(_manifest), "variants": sum(len(v) for v in _variants.values()),
+                "brotli": brotli is not None, "images": Image is not None}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fingerprint and precompress static assets")
+    parser.add_argument("--static-dir", default=STATIC_DIR)
+    parser.add_argument("--clean", action="store_true", help="remove the dist folder and exit")
+    args = parser.parse_args()
+    if args.clean:
+        shutil.rmtree(_dist_dir(args.static_dir), ignore_errors=True)
+    else:
+        result = build(args.static_dir)
+        dist = _dist_dir(args.static_dir)
+        total = sum(os.path.getsize(os.path.join(dist, h)) for h in result["files"].values())
+        print(f"Built {len(result['files'])} assets ({total / 1024:.0f} KiB) and "
+              f"{sum(len(v) for v in result['variants'].values())} variants into {dist}")
@@ -1,26 +1,189 @@
 # auth.py
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
 import random
 from models import OTP
 from database import SessionLocal
 import os
-import smtplib
-from email.message import EmailMessage
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from mailer import get_mailer
 
 # Secret key for JWT (change to secure in production)
 SECRET_KEY = os.environ.get("JWT_SECRET", "change_me_please")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60*24
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost; existing hashes with a different cost are upgraded on next login
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+# Dedicated worker processes for bcrypt, and how many requests may wait on them
+# before new ones are rejected (keeps login bursts from eating the threadpool)
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_MAX_PENDING = int(os.environ.get("HASH_MAX_PENDING", str(max(HASH_WORKERS, 1) * 4)))
+HASH_TIMEOUT = float(os.environ.get("HASH_TIMEOUT_S", "10"))
+
+_pwd_context = None
+
+
+def pwd_context():
+    # passlib is imported and configured on first use, in whichever process hashes
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+    return _pwd_context
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def _bcrypt_rounds(hashed: str) -> int | None:
+    # $2b$12$<salt+checksum>
+    parts = hashed.split("$")
+    try:
+        return int(parts[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def _hash_job(password: str, submitted: float):
+    started = time.time()
+    hashed = pwd_context().hash(password)
+    return hashed, started - submitted, time.time() - started
+
+
+def _verify_job(plain: str, hashed: str, rehash: bool, submitted: float):
+    started = time.time()
+    ok = pwd_context().verify(plain, hashed)
+    new_hash = None
+    if ok and rehash and _bcrypt_rounds(hashed) != BCRYPT_ROUNDS:
+        new_hash = pwd_context().hash(plain)
+    return (ok, new_hash), started - submitted, time.time() - started
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a size-limited process pool. At most max_pending calls may
+    be running or queued; beyond that calls fail fast with HasherBusy.
+    workers=0 runs inline (tests, benchmarks).
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self._stats = {"calls": 0, "rejected": 0, "timeouts": 0, "rehashed": 0, "hash_ms_total": 0.0,
+                       "hash_ms_max": 0.0, "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                from concurrent.futures import ProcessPoolExecutor
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def _release(self, _future=None):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise HasherBusy("Password hashing is saturated, retry shortly")
+        with self._lock:
+            self.pending += 1
+        if self.workers <= 0:
+            try:
+                result, waited, took = fn(*args, time.time())
+            finally:
+                self._release()
+        else:
+            try:
+                future = self._pool().submit(fn, *args, time.time())
+            except BaseException:
+                self._release()
+                raise
+            # The slot is held until the job really finishes, not just until we stop waiting,
+            # so max_pending keeps bounding the work in the pool
+            future.add_done_callback(self._release)
+            try:
+                result, waited, took = future.result(timeout=HASH_TIMEOUT)
+            except FutureTimeout:
+                with self._lock:
+                    self._stats["timeouts"] += 1
+                raise HasherBusy("Password hashing timed out, retry shortly")
+            except BrokenProcessPool:
+                with self._lock:
+                    self._executor = None
+                raise
+        with self._lock:
+            s = self._stats
+            s["calls"] += 1
+            s["hash_ms_total"] += took * 1000.0
+            s["hash_ms_max"] = max(s["hash_ms_max"], took * 1000.0)
+            s["wait_ms_total"] += max(waited, 0.0) * 1000.0
+            s["wait_ms_max"] = max(s["wait_ms_max"], waited * 1000.0)
+        return result
+
+    def hash(self, password: str) -> str:
+        return self._run(_hash_job, password)
+
+    def verify(self, plain: str, hashed: str) -> bool:
+        ok, _ = self._run(_verify_job, plain, hashed, False)
+        return ok
+
+    def verify_and_update(self, plain: str, hashed: str):
+        ok, new_hash = self._run(_verify_job, plain, hashed, True)
+        if new_hash:
+            with self._lock:
+                self._stats["rehashed"] += 1
+        return ok, new_hash
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            pending = self.pending
+        calls = s["calls"] or 1
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": pending,
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+            "calls": s["calls"],
+            "rejected": s["rejected"],
+            "timeouts": s["timeouts"],
+            "rehashed": s["rehashed"],
+            "avg_hash_ms": round(s["hash_ms_total"] / calls, 3),
+            "max_hash_ms": round(s["hash_ms_max"], 3),
+            "avg_wait_ms": round(s["wait_ms_total"] / calls, 3),
+            "max_wait_ms": round(s["wait_ms_max"], 3),
+        }
+
+
+hasher = PasswordHasher()
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return hasher.hash(password)
 
 def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
+    return hasher.verify(plain, hashed)
+
+def verify_and_update_password(plain: str, hashed: str):
+    """Returns (ok, new_hash); new_hash is set when the stored hash uses an old bcrypt cost."""
+    return hasher.verify_and_update(plain, hashed)
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
@@ -29,10 +192,12 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 def decode_access_token(token: str):
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return payload
@@ -45,24 +210,14 @@ def generate_otp_code(length=6):
 
 def send_otp(email: str, code: str, purpose: str = "register"):
     """
-    Send an OTP. If SMTP env variables are set it will send actual email.
+    Send an OTP. If SMTP_HOST is set the mail is queued for the background
+    sender (see mailer.py) and this returns immediately.
     Otherwise it will print to console (useful for dev).
     """
-    SMTP_HOST = os.environ.get("SMTP_HOST")
-    SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
-    SMTP_USER = os.environ.get("SMTP_USER")
-    SMTP_PASS = os.environ.get("SMTP_PASS")
-    if SMTP_HOST and SMTP_USER and SMTP_PASS:
-        msg = EmailMessage()
-        msg["Subject"] = f"Your OTP for {purpose}"
-        msg["From"] = SMTP_USER
-        msg["To"] = email
-        msg.set_content(f"Your OTP code: {code}\nIt will expire in 10 minutes.")
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as s:
-            s.starttls()
-            s.login(SMTP_USER, SMTP_PASS)
-            s.send_message(msg)
+    mailer = get_mailer()
+    if mailer:
+        mailer.enqueue(email, f"Your OTP for {purpose}", f"Your OTP code: {code}\nIt will expire in 10 minutes.")
     else:
         # no SMTP configured — print to console (dev)
         print(f"[OTP] {purpose} -> {email} : {code}")
-        return
\ No newline at end of file
+        return
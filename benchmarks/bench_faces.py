@@ -0,0 +1,60 @@
+# benchmarks/bench_faces.py
+# Face index search latency: one probe and batched probes against N enrolled
+# drivers, plus enroll/remove cost, on a temp memory-mapped index.
+# Run from anywhere:
+#   python benchmarks/bench_faces.py [--faces 100000] [--dim 128] [--batch 32] [--repeat 20]
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faces  # noqa: E402
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Face-embedding index benchmark")
+    parser.add_argument("--faces", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=faces.FACE_EMBEDDING_DIM)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    index = faces.FaceIndex(tempfile.mkdtemp(prefix="faces-"), args.dim)
+    embeddings = rng.standard_normal((args.faces, args.dim), dtype=np.float32)
+    started = time.perf_counter()
+    for first in range(0, args.faces, 10000):
+        index.enroll_many(list(range(first + 1, min(first + 10000, args.faces) + 1)), embeddings[first:first + 10000])
+    print(f"enrolled {args.faces:,} x {args.dim}-d in {time.perf_counter() - started:.2f}s "
+          f"({index.capacity * args.dim * 4 / 2 ** 20:.0f} MiB mapped)")
+
+    # Probes are noisy copies of enrolled faces, as a camera would produce
+    probes = embeddings[rng.integers(0, args.faces, args.batch)] + 0.3 * rng.standard_normal((args.batch, args.dim))
+    one = best_of(lambda: index.search(probes[0]), args.repeat)
+    many = best_of(lambda: index.search(probes), args.repeat)
+    verify = best_of(lambda: index.verify(1, embeddings[0]), args.repeat)
+    enroll = best_of(lambda: index.enroll(args.faces + 1, probes[0]), args.repeat)
+    remove = best_of(lambda: (index.remove(1), index.enroll(1, embeddings[0])), args.repeat)
+    print(f"{'search 1 probe':>22} {one * 1000:>9.2f} ms")
+    print(f"{f'search {args.batch} probes':>22} {many * 1000:>9.2f} ms  ({many / args.batch * 1000:.3f} ms/probe)")
+    print(f"{'verify':>22} {verify * 1000:>9.2f} ms")
+    print(f"{'enroll (replace)':>22} {enroll * 1000:>9.2f} ms")
+    print(f"{'remove + re-enroll':>22} {remove * 1000:>9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# benchmarks/bench_landmarks.py
+# Frames/sec per core for EAR/MAR: vectorized landmarks.compute_ratios vs a
+# per-frame Python loop.  Run from the repo root:
+#   python benchmarks/bench_landmarks.py [--frames 20000] [--repeat 5]
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import landmarks  # noqa: E402
+
+
+def _ear_loop(frame, layout):
+    def d(a, b):
+        return math.dist(frame[a][:2], frame[b][:2])
+
+    out = []
+    for eye in (layout["left_eye"], layout["right_eye"]):
+        p1, p2, p3, p4, p5, p6 = eye
+        out.append((d(p2, p6) + d(p3, p5)) / (2.0 * d(p1, p4)))
+    m = layout["mouth"]
+    mar = (d(m[1], m[7]) + d(m[2], m[6]) + d(m[3], m[5])) / (3.0 * d(m[0], m[4]))
+    return sum(out) / 2.0, mar
+
+
+def per_frame_loop(frames):
+    layout = landmarks._LAYOUTS[frames.shape[1]]
+    rows = frames.tolist()
+    return [_ear_loop(f, layout) for f in rows]
+
+
+def best_of(fn, arg, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EAR/MAR throughput benchmark")
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'layout':>8} {'frames':>8} {'vectorized fps':>16} {'loop fps':>12} {'speedup':>8}")
+    for points, dims in ((68, 2), (468, 3)):
+        frames = rng.random((args.frames, points, dims), dtype=np.float32)
+        vec = best_of(landmarks.compute_ratios, frames, args.repeat)
+        loop = best_of(per_frame_loop, frames[: max(args.frames // 10, 1)], args.repeat) * 10
+        print(f"{points:>8} {args.frames:>8} {args.frames / vec:>16,.0f} {args.frames / loop:>12,.0f} {loop / vec:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
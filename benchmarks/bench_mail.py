@@ -0,0 +1,130 @@
+# benchmarks/bench_mail.py
+# Mail queue against a real SMTP socket: a minimal in-process SMTP sink
+# (stdlib only) receives everything the Mailer sends, so delivery, connection
+# reuse and the reconnect after a dropped connection are checked end to end.
+# Run from anywhere:
+#   python benchmarks/bench_mail.py [--messages 200] [--drop-after 50]
+# or keep the sink running for manual tests with mailer.py:
+#   python benchmarks/bench_mail.py --serve 1025
+import argparse
+import os
+import socketserver
+import sys
+import threading
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mailer  # noqa: E402
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Accepts any sender and recipient and keeps the raw messages in memory."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 0), drop_after: int = 0, echo: bool = False):
+        super().__init__(address, _SMTPHandler)
+        self.messages: List[bytes] = []
+        self.connections = 0
+        # Close the connection without a reply after this many messages (0: never)
+        self.drop_after = drop_after
+        self.echo = echo
+        self.lock = threading.Lock()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str):
+        self.wfile.write(line.encode() + b"\r\n")
+        self.wfile.flush()
+
+    def handle(self):
+        sink: SMTPSink = self.server
+        with sink.lock:
+            sink.connections += 1
+        self.reply("220 sink ESMTP")
+        received = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith("EHLO"):
+                self.reply("250-sink")
+                self.reply("250 8BITMIME")
+            elif command.startswith(("HELO", "MAIL", "RCPT", "RSET", "NOOP")):
+                self.reply("250 OK")
+            elif command == "DATA":
+                if sink.drop_after and received >= sink.drop_after:
+                    return
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                for data in iter(self.rfile.readline, b""):
+                    if data in (b".\r\n", b".\n"):
+                        break
+                    lines.append(data[1:] if data.startswith(b"..") else data)
+                body = b"".join(lines)
+                with sink.lock:
+                    sink.messages.append(body)
+                if sink.echo:
+                    print(body.decode(errors="replace"))
+                received += 1
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mail queue check against a local SMTP sink")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--drop-after", type=int, default=50, help="sink drops the connection after this many messages")
+    parser.add_argument("--serve", type=int, default=None, metavar="PORT", help="only run the sink, printing messages")
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        sink = SMTPSink(("127.0.0.1", args.serve), echo=True)
+        print(f"SMTP sink on 127.0.0.1:{sink.port} (SMTP_STARTTLS=0); Ctrl-C to stop")
+        try:
+            sink.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    sink = SMTPSink(drop_after=args.drop_after)
+    threading.Thread(target=sink.serve_forever, name="smtp-sink", daemon=True).start()
+    outbox = mailer.Mailer("127.0.0.1", sink.port, starttls=False, sender="bench@localhost", backoff=0.05)
+    started = time.perf_counter()
+    for i in range(args.messages):
+        outbox.enqueue(f"driver{i}@example.com", f"Code {i}", f"Your code is {i:06d}.")
+    outbox.stop(timeout=60)
+    elapsed = time.perf_counter() - started
+    sink.shutdown()
+
+    stats = outbox.stats()
+    print(f"sent {stats['sent']}/{args.messages} in {elapsed:.2f}s ({stats['sent'] / elapsed:,.0f} msg/s), "
+          f"{stats['connects']} connects, {stats['retries']} retries, avg send {stats['avg_send_ms']:.3f} ms")
+    bodies = {m.split(b"Your code is ")[-1][:6] for m in sink.messages}
+    expected = {f"{i:06d}".encode() for i in range(args.messages)}
+    drops = (args.messages - 1) // args.drop_after if args.drop_after else 0
+    problems = []
+    if stats["sent"] != args.messages or stats["failed"]:
+        problems.append(f"mailer reported {stats['sent']} sent, {stats['failed']} failed")
+    if bodies != expected:
+        problems.append(f"sink is missing {len(expected - bodies)} messages")
+    if stats["connects"] != 1 + drops:
+        problems.append(f"expected {1 + drops} connects (one per dropped connection), got {stats['connects']}")
+    if problems:
+        raise SystemExit("FAIL: " + "; ".join(problems))
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# benchmarks/bench_micro.py
+# Micro-benchmarks for the hot paths behind login, OTP verification and log
+# ingest, run offline against a temp SQLite file.  Run from anywhere:
+#   python benchmarks/bench_micro.py [--iterations 2000] [--only token,otp] [--compare old.json]
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import harness  # noqa: E402
+
+harness.offline_env()
+
+import auth  # noqa: E402
+import database  # noqa: E402
+import log_writer  # noqa: E402
+import migrations  # noqa: E402
+import otps  # noqa: E402
+import telemetry  # noqa: E402
+from models import OTP  # noqa: E402
+
+
+def bench_tokens(n):
+    token = auth.create_access_token({"sub": "driver@example.com", "user_id": 1})
+    return {
+        "token_encode": harness.time_calls(lambda: auth.create_access_token({"sub": "driver@example.com", "user_id": 1}), n),
+        "token_decode": harness.time_calls(lambda: auth.decode_access_token(token), n),
+    }
+
+
+def bench_bcrypt(n):
+    # Inline hasher so the numbers are bcrypt itself, not pool hand-off
+    hasher = auth.PasswordHasher(workers=0)
+    hashed = hasher.hash("correct horse battery staple")
+    n = max(5, n // 200)
+    return {
+        f"bcrypt_hash_r{auth.BCRYPT_ROUNDS}": harness.time_calls(lambda: hasher.hash("correct horse battery staple"), n),
+        f"bcrypt_verify_r{auth.BCRYPT_ROUNDS}": harness.time_calls(lambda: hasher.verify("correct horse battery staple", hashed), n),
+    }
+
+
+def bench_otp(n, rows=20000):
+    expiry = datetime.utcnow() + timedelta(minutes=10)
+    with database.SessionLocal() as db:
+        db.execute(OTP.__table__.delete())
+        db.execute(OTP.__table__.insert(), [
+            {"user_id": i, "email": f"user{i}@example.com", "code": f"{i % 1000000:06d}",
+             "expiry": expiry, "purpose": "register"}
+            for i in range(rows)
+        ])
+        db.commit()
+    rng = random.Random(0)
+
+    def lookup():
+        i = rng.randrange(rows)
+        with database.SessionLocal() as db:
+            assert otps.find_active(db, f"user{i}@example.com", f"{i % 1000000:06d}", "register") is not None
+
+    return {"otp_lookup": harness.time_calls(lookup, n)}
+
+
+def _row(i):
+    return {
+        "driver_id": i % 50 + 1,
+        "event_type": "face_metrics",
+        "data": telemetry.encode_data({"ear": 0.3, "mar": 0.1, "speed": 60.0}),
+        "timestamp": datetime.utcnow(),
+    }
+
+
+def bench_log_insert(n, batch=500):
+    counter = iter(range(10 ** 9))
+
+    def single():
+        with database.SessionLocal() as db:
+            telemetry.insert_log_batch(db, [_row(next(counter))])
+
+    def batched():
+        with database.SessionLocal() as db:
+            telemetry.insert_log_batch(db, [_row(next(counter)) for _ in range(batch)])
+
+    results = {"log_insert_single": harness.time_calls(single, max(50, n // 4))}
+    r = harness.time_calls(batched, max(5, n // 100))
+    r["rows_per_s"] = round(r["ops_per_s"] * batch, 1)
+    results[f"log_insert_batch_{batch}"] = r
+
+    # The /api/driver/log path: write-behind queue, waiting for the group commit (durable, the default)
+    writer = log_writer.LogWriter()
+    writer.start()
+    try:
+        results["log_writer_durable"] = harness.time_calls(
+            lambda: writer.submit(_row(next(counter)), durable=True).result(5), max(50, n // 4))
+    finally:
+        writer.stop()
+    return results
+
+
+CASES = {"token": bench_tokens, "bcrypt": bench_bcrypt, "otp": bench_otp, "log": bench_log_insert}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline micro-benchmarks")
+    parser.add_argument("--iterations", type=int, default=2000, help="base iteration count; slow cases run fewer")
+    parser.add_argument("--only", default=",".join(CASES), help=f"comma-separated subset of {', '.join(CASES)}")
+    parser.add_argument("--out", default=None, help="results file (default: benchmarks/results/micro-<time>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results file to diff against")
+    args = parser.parse_args()
+
+    migrations.ensure_schema(database.engine)
+    harness.stub_send_otp()
+    results = {}
+    for name in args.only.split(","):
+        results.update(CASES[name.strip()](args.iterations))
+    auth.hasher.shutdown()
+
+    harness.print_table(results, "ops_per_s")
+    print(f"\nSaved {harness.save_results('micro', results, args, args.out)}")
+    if args.compare:
+        harness.compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/bench_wire.py
+# Payload size and server-side parse speed: JSON / form-encoded telemetry vs
+# the binary wire format.  Run from the repo root:
+#   python benchmarks/bench_wire.py [--events 10000] [--repeat 5]
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlencode
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telemetry  # noqa: E402
+import wire  # noqa: E402
+
+
+def make_events(n):
+    rng = np.random.default_rng(0)
+    start = datetime(2024, 1, 1)
+    ears = rng.uniform(0.15, 0.35, n).round(4).tolist()
+    mars = rng.uniform(0.0, 0.8, n).round(4).tolist()
+    return [
+        {
+            "driver_id": int(i % 50) + 1,
+            "event_type": "face_metrics",
+            "timestamp": (start + timedelta(milliseconds=100 * i)).isoformat(),
+            "data": {"ear": ears[i], "mar": mars[i], "speed": 62.5, "confidence": 0.97},
+        }
+        for i in range(n)
+    ]
+
+
+def parse_json(body):
+    return [telemetry.validate_event(item) for item, _ in telemetry.iter_json_array(body)]
+
+
+def parse_form(bodies):
+    out = []
+    for body in bodies:
+        form = {k: v[0] for k, v in parse_qs(body).items()}
+        out.append(telemetry.validate_event({
+            "driver_id": form["driver_id"], "event_type": form["event_type"],
+            "data": json.loads(form["data"]), "timestamp": form["timestamp"],
+        }))
+    return out
+
+
+def parse_wire(body):
+    return wire.decode(body).rows()
+
+
+def best_of(fn, arg, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Telemetry wire format benchmark")
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    events = make_events(args.events)
+    json_body = json.dumps(events, separators=(",", ":")).encode()
+    form_bodies = [
+        urlencode({"driver_id": e["driver_id"], "event_type": e["event_type"],
+                   "data": json.dumps(e["data"]), "timestamp": e["timestamp"]})
+        for e in events
+    ]
+    wire_body = wire.encode(events)
+
+    cases = [
+        ("form (per event)", sum(len(b) for b in form_bodies), parse_form, form_bodies),
+        ("json array", len(json_body), parse_json, json_body),
+        ("binary rows", len(wire_body), parse_wire, wire_body),
+        ("binary decode", len(wire_body), wire.decode, wire_body),
+    ]
+    timings = [(name, size, best_of(fn, arg, args.repeat)) for name, size, fn, arg in cases]
+    base = dict((name, seconds) for name, _, seconds in timings)["json array"]
+    print(f"{'format':>18} {'bytes/event':>12} {'events/sec':>14} {'vs json':>8}")
+    for name, size, seconds in timings:
+        print(f"{name:>18} {size / args.events:>12.1f} {args.events / seconds:>14,.0f} {base / seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
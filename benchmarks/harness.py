@@ -0,0 +1,135 @@
+# benchmarks/harness.py
+# Shared setup for the offline benchmarks: a throwaway SQLite database, no
+# SMTP, latency percentiles and JSON result files that can be compared
+# between runs (--compare old.json).
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+
+def offline_env(workdir: Optional[str] = None) -> str:
+    """
+    Point the app at a temp-file SQLite database with mail and log
+    archiving off. Must run before any app module is imported, since they
+    read their settings at import time. Returns the temp directory.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["LOG_ARCHIVE_DIR"] = os.path.join(workdir, "archive")
+    os.environ["JINJA_CACHE_DIR"] = os.path.join(workdir, "jinja")
+    os.environ["LOG_RETENTION_DAYS"] = "0"
+    os.environ.pop("SMTP_HOST", None)
+    # templates/ and static/ are resolved relative to the working directory
+    os.chdir(ROOT)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    return workdir
+
+
+def stub_send_otp() -> List[tuple]:
+    """Replace send_otp everywhere it was imported with a recorder; returns the list it appends to."""
+    sent: List[tuple] = []
+
+    def send_otp(email: str, code: str, purpose: str = "register"):
+        sent.append((email, code, purpose))
+
+    for name in ("auth", "main"):
+        module = sys.modules.get(name)
+        if module is not None and hasattr(module, "send_otp"):
+            module.send_otp = send_otp
+    return sent
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds (nearest-rank percentiles) for samples in seconds."""
+    if not samples:
+        return {"n": 0}
+    ordered = sorted(samples)
+    n = len(ordered)
+
+    def rank(p: float) -> float:
+        # Nearest rank: the smallest sample with at least p% of samples at or below it
+        return ordered[min(n - 1, max(0, math.ceil(p / 100.0 * n) - 1))] * 1000.0
+
+    return {
+        "n": n,
+        "mean_ms": round(sum(ordered) / n * 1000.0, 4),
+        "p50_ms": round(rank(50), 4),
+        "p95_ms": round(rank(95), 4),
+        "p99_ms": round(rank(99), 4),
+        "max_ms": round(ordered[-1] * 1000.0, 4),
+    }
+
+
+def time_calls(fn: Callable[[], object], iterations: int, min_seconds: float = 0.0) -> Dict[str, float]:
+    """Call fn repeatedly, timing each call; runs at least `iterations` times and `min_seconds`."""
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < iterations or time.perf_counter() - started < min_seconds:
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    return {"ops_per_s": round(len(samples) / elapsed, 2), **percentiles(samples)}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def save_results(kind: str, results: Dict[str, dict], args, path: Optional[str] = None) -> str:
+    """Write results with enough context (commit, python, args) to compare runs later."""
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{kind}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    payload = {
+        "kind": kind,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": vars(args),
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2)
+    return path
+
+
+def compare(path: str, results: Dict[str, dict], keys=("ops_per_s", "rps", "p50_ms", "p95_ms", "p99_ms")):
+    """Print the change against an earlier results file for every case present in both."""
+    with open(path) as f:
+        old = json.load(f)
+    print(f"\nvs {os.path.basename(path)} (commit {old.get('commit')})")
+    for name, new in results.items():
+        before = old.get("results", {}).get(name)
+        if not before:
+            continue
+        parts = []
+        for key in keys:
+            if key in new and before.get(key):
+                change = (new[key] - before[key]) / before[key] * 100.0
+                parts.append(f"{key} {before[key]:g} -> {new[key]:g} ({change:+.1f}%)")
+        print(f"  {name}: " + ", ".join(parts))
+
+
+def print_table(results: Dict[str, dict], rate_key: str):
+    print(f"{'case':>34} {rate_key:>12} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'n':>8}")
+    for name, r in results.items():
+        print(f"{name:>34} {r.get(rate_key, 0):>12,.1f} {r.get('p50_ms', 0):>9.3f} "
+              f"{r.get('p95_ms', 0):>9.3f} {r.get('p99_ms', 0):>9.3f} {r.get('n', 0):>8}")
@@ -0,0 +1,142 @@
+# benchmarks/load.py
+# Concurrent load driver: per-endpoint requests/sec and p50/p95/p99 latency.
+# By default the app runs in-process (httpx ASGI transport, lifespan and all)
+# against a temp SQLite file with send_otp stubbed, so it needs no network.
+# --url targets a running server instead.  Needs httpx.  Run from anywhere:
+#   python benchmarks/load.py [--concurrency 16] [--duration 5] [--only login,driver_log]
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import harness  # noqa: E402
+
+PASSWORD = "bench-password-1"
+
+
+def _events(n: int) -> List[dict]:
+    return [{"driver_id": i % 50 + 1, "event_type": "face_metrics", "data": {"ear": 0.28, "mar": 0.1}}
+            for i in range(n)]
+
+
+# name -> (method, path, request kwargs factory); factories take the scenario state
+SCENARIOS: Dict[str, tuple] = {
+    "landing_page": ("GET", "/", lambda s: {}),
+    "login_page": ("GET", "/login", lambda s: {}),
+    "login_page_304": ("GET", "/login", lambda s: {"headers": {"if-none-match": s.get("login_etag", "")}}),
+    "drivers_page": ("GET", "/drivers", lambda s: {}),
+    "driver_log": ("POST", "/api/driver/log", lambda s: {"data": {
+        "token": "bench", "driver_id": "1", "event_type": "face_metrics", "data": '{"ear": 0.3, "mar": 0.1}'}}),
+    "driver_log_queued": ("POST", "/api/driver/log", lambda s: {"data": {
+        "token": "bench", "driver_id": "1", "event_type": "face_metrics", "data": '{"ear": 0.3}', "durable": "false"}}),
+    "logs_batch_50": ("POST", "/api/driver/logs/batch", lambda s: {"json": s["batch"]}),
+    "login": ("POST", "/api/login", lambda s: {"data": {"email": s["email"], "password": PASSWORD}}),
+    "list_logs": ("GET", "/api/logs", lambda s: {"params": {"limit": 50}}),
+    "fleet_summary": ("GET", "/api/fleet/summary", lambda s: {}),
+}
+
+
+async def run_endpoint(client, name: str, state: dict, concurrency: int, duration: float,
+                       max_requests: int) -> dict:
+    method, path, kwargs_for = SCENARIOS[name]
+    samples: List[float] = []
+    statuses: Dict[str, int] = {}
+    errors = 0
+    deadline = time.perf_counter() + duration
+    issued = 0
+
+    async def worker():
+        nonlocal errors, issued
+        while time.perf_counter() < deadline and (not max_requests or issued < max_requests):
+            issued += 1
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs_for(state))
+                status = str(response.status_code)
+            except Exception:
+                errors += 1
+                status = "error"
+            samples.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {"rps": round(len(samples) / elapsed, 2), **harness.percentiles(samples),
+            "status": statuses, "errors": errors, "concurrency": concurrency}
+
+
+def _seed_user(email: str):
+    import auth
+    import database
+    from models import User
+    with database.SessionLocal() as db:
+        if db.query(User).filter(User.email == email).first() is None:
+            db.add(User(username="bench", email=email, password_hash=auth.get_password_hash(PASSWORD),
+                        is_admin=False, is_verified=True))
+            db.commit()
+
+
+async def run(args, names: List[str]) -> Dict[str, dict]:
+    import httpx
+
+    state = {"email": "bench@example.com", "batch": _events(50)}
+    results = {}
+
+    async def drive(client):
+        response = await client.get("/login")
+        state["login_etag"] = response.headers.get("etag", "")
+        for name in names:
+            # Short warm-up so caches, pools and lazy imports are not billed to the first samples
+            await run_endpoint(client, name, state, min(args.concurrency, 4), 0.3, 20)
+            results[name] = await run_endpoint(client, name, state, args.concurrency, args.duration, args.requests)
+            r = results[name]
+            print(f"{name:>20}  {r['rps']:>9,.1f} req/s  p50 {r['p50_ms']:>8.2f}  p95 {r['p95_ms']:>8.2f}  "
+                  f"p99 {r['p99_ms']:>8.2f} ms  {r['status']}")
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=30) as client:
+            await drive(client)
+        return results
+
+    import main
+    harness.stub_send_otp()
+    app = main.create_app()
+    async with app.router.lifespan_context(app):
+        if "login" in names:
+            await asyncio.to_thread(_seed_user, state["email"])
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=30) as client:
+            await drive(client)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-endpoint load test")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight per endpoint")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per endpoint")
+    parser.add_argument("--requests", type=int, default=0, help="stop each endpoint after this many requests")
+    parser.add_argument("--only", default=",".join(SCENARIOS), help=f"comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--url", default=None, help="load a running server instead of the in-process app")
+    parser.add_argument("--out", default=None, help="results file (default: benchmarks/results/load-<time>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results file to diff against")
+    args = parser.parse_args()
+    names = [n.strip() for n in args.only.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)}")
+    if not args.url:
+        harness.offline_env()
+
+    results = asyncio.run(run(args, names))
+    print(f"\nSaved {harness.save_results('load', results, args, args.out)}")
+    if args.compare:
+        harness.compare(args.compare, results, keys=("rps", "p50_ms", "p95_ms", "p99_ms"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,98 @@
 # database.py
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import StaticPool
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./app.db")
+
+# SQLite profile: WAL lets dashboard reads run alongside the log writer
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", "65536"))
+
+# Pool profile for server databases (PostgreSQL, MySQL, ...)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "1").lower() not in ("0", "false", "no")
+DB_ECHO = os.environ.get("DB_ECHO", "0").lower() in ("1", "true", "yes")
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url
+
 
-DATABASE_URL = "sqlite:///./app.db"
+def _set_sqlite_pragmas(dbapi_conn, _record):
+    cur = dbapi_conn.cursor()
+    try:
+        cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cur.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cur.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cur.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        # Negative cache_size is in KiB rather than pages
+        cur.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cur.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cur.close()
 
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
-)
+
+def make_engine(url: str = DATABASE_URL) -> Engine:
+    if url.startswith("sqlite"):
+        kwargs = {"connect_args": {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000.0}}
+        if _is_memory_sqlite(url):
+            # One shared connection, otherwise every session sees its own empty database
+            kwargs["poolclass"] = StaticPool
+        eng = create_engine(url, echo=DB_ECHO, **kwargs)
+        event.listen(eng, "connect", _set_sqlite_pragmas)
+        return eng
+    return create_engine(
+        url,
+        echo=DB_ECHO,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+
+
+def describe_engine(eng: Engine = None) -> dict:
+    """Self-check: connect once and report the settings actually in effect."""
+    eng = eng or engine
+    info = {
+        "url": eng.url.render_as_string(hide_password=True),
+        "dialect": eng.dialect.name,
+        "pool": type(eng.pool).__name__,
+    }
+    with eng.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        if eng.dialect.name == "sqlite":
+            info["sqlite_version"] = conn.exec_driver_sql("select sqlite_version()").scalar()
+            for pragma in ("journal_mode", "synchronous", "busy_timeout", "mmap_size", "cache_size"):
+                info[pragma] = conn.exec_driver_sql(f"PRAGMA {pragma}").scalar()
+        else:
+            info.update({
+                "pool_size": DB_POOL_SIZE,
+                "max_overflow": DB_MAX_OVERFLOW,
+                "pool_timeout": DB_POOL_TIMEOUT,
+                "pool_recycle": DB_POOL_RECYCLE,
+                "pool_pre_ping": DB_POOL_PRE_PING,
+            })
+            info["server_version"] = ".".join(str(v) for v in eng.dialect.server_version_info or ())
+    return info
+
+
+engine = make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+
+if __name__ == "__main__":
+    for key, value in describe_engine().items():
+        print(f"{key}: {value}")
@@ -0,0 +1,350 @@
+# drivers.py
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import bindparam, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import telemetry
+from database import SessionLocal
+from models import CacheVersion, DriverProfile
+
+CACHE_NAME = "drivers"
+# Bumped by live-field writes only, so they reach other workers without a full reload
+LIVE_CACHE_NAME = "drivers_live"
+# How often a worker re-reads the drivers version row to pick up writes made by other workers
+DRIVER_CACHE_CHECK_S = float(os.environ.get("DRIVER_CACHE_CHECK_S", "1.0"))
+# Ingested EAR/MAR samples are written to a driver's row at most this often (latest sample wins)
+DRIVER_LIVE_WRITE_S = float(os.environ.get("DRIVER_LIVE_WRITE_S", "1.0"))
+
+# API/template field name -> DriverProfile column
+FIELD_COLUMNS = {
+    "name": "name",
+    "vehicle": "vehicle_no",
+    "phone": "phone",
+    "license": "license",
+    "status": "status",
+    "status_color": "status_color",
+    "bg_color": "bg_color",
+    "shift_start": "shift_start",
+    "drive_time": "drive_time",
+    "distance": "distance",
+    "photo": "photo",
+    "score": "score",
+    "ear": "ear",
+    "mar": "mar",
+    "auth_status": "auth_status",
+    "face_confidence": "face_confidence",
+    "last_verified": "last_verified",
+}
+
+# Columns written by update_live(); a live version change re-reads only these
+LIVE_FIELDS = ("score", "ear", "mar", "auth_status", "face_confidence", "last_verified")
+
+NEW_DRIVER_DEFAULTS = {
+    "score": 100,
+    "status_color": "#34d399",
+    "drive_time": "0h 0m",
+    "distance": "0 km",
+    "photo": "/static/img/driver_1.png",  # Placeholder
+    "ear": 0.30,
+    "mar": 0.02,
+    "auth_status": "Verified",
+    "face_confidence": 99.0,
+    "last_verified": "Just now",
+}
+
+
+def to_dict(dp: DriverProfile) -> dict:
+    out = {"id": dp.id}
+    for field, column in FIELD_COLUMNS.items():
+        out[field] = getattr(dp, column)
+    if out["score"] is not None:
+        out["score"] = int(round(out["score"]))
+    return out
+
+
+def _columns(data: dict) -> dict:
+    return {FIELD_COLUMNS[k]: v for k, v in data.items() if k in FIELD_COLUMNS}
+
+
+def _bump_version(db: Session, name: str = CACHE_NAME):
+    dialect = db.get_bind().dialect.name
+    ins = postgresql.insert(CacheVersion) if dialect == "postgresql" else sqlite.insert(CacheVersion)
+    db.execute(
+        ins.values(name=name, version=1)
+        .on_conflict_do_update(index_elements=["name"], set_={"version": CacheVersion.version + 1})
+    )
+
+
+def _read_version(db: Session, name: str = CACHE_NAME) -> int:
+    return db.scalar(select(CacheVersion.version).where(CacheVersion.name == name)) or 0
+
+
+def _read_versions(db: Session) -> tuple:
+    rows = dict(db.execute(
+        select(CacheVersion.name, CacheVersion.version).where(CacheVersion.name.in_((CACHE_NAME, LIVE_CACHE_NAME)))
+    ).all())
+    return rows.get(CACHE_NAME, 0), rows.get(LIVE_CACHE_NAME, 0)
+
+
+class DriverRegistry:
+    """
+    Driver records backed by the drivers table, with an in-memory read-through
+    copy. Writes go to the database and bump the 'drivers' cache version in
+    the same transaction; readers reload when the version they last saw is
+    behind, checking at most every DRIVER_CACHE_CHECK_S seconds. Live-field
+    writes bump 'drivers_live' instead, which makes readers re-read just
+    the live columns and leaves version() (used to key cached pages) alone.
+    """
+
+    def __init__(self, session_factory=SessionLocal, check_interval: float = DRIVER_CACHE_CHECK_S):
+        self.session_factory = session_factory
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._drivers: Dict[int, dict] = {}
+        self._list: List[dict] = []
+        self._version: Optional[int] = None
+        self._live_version: Optional[int] = None
+        self._checked_at = 0.0
+        self._listeners: List[Callable[[Dict[int, Optional[dict]], bool], None]] = []
+        self._live_written: Dict[int, float] = {}
+        self.reloads = 0
+
+    # --- change listeners ---
+
+    def add_listener(self, fn: Callable[[Dict[int, Optional[dict]], bool], None]):
+        """
+        fn(changed, reset) runs after every change with {driver_id: driver or
+        None if deleted}. reset=True means changed holds the whole fleet.
+        """
+        self._listeners.append(fn)
+
+    def _notify(self, changed: Dict[int, Optional[dict]], reset: bool = False):
+        for fn in self._listeners:
+            try:
+                fn(changed, reset)
+            except Exception as e:
+                print(f"Driver Listener Error: {e}")
+
+    # --- reads ---
+
+    def _reload(self, db: Session, version: int):
+        rows = db.scalars(select(DriverProfile).order_by(DriverProfile.id)).all()
+        drivers = {dp.id: to_dict(dp) for dp in rows}
+        self._drivers = drivers
+        self._list = list(drivers.values())
+        self._version = version
+        self.reloads += 1
+        self._notify(drivers, reset=True)
+
+    def _reload_live(self, db: Session):
+        columns = [getattr(DriverProfile, FIELD_COLUMNS[f]) for f in LIVE_FIELDS]
+        changed = {}
+        for row in db.execute(select(DriverProfile.id, *columns)):
+            driver = self._drivers.get(row[0])
+            if driver is None:
+                continue
+            fields = dict(zip(LIVE_FIELDS, row[1:]))
+            if fields["score"] is not None:
+                fields["score"] = int(round(fields["score"]))
+            if any(driver.get(k) != v for k, v in fields.items()):
+                changed[row[0]] = {**driver, **fields}
+        if changed:
+            self._swap_in(changed)
+            self._notify(changed)
+
+    def _swap_in(self, changed: Dict[int, dict]):
+        # Copy-on-write: readers holding the previous dicts or list never see a half-applied update
+        drivers = dict(self._drivers)
+        drivers.update(changed)
+        self._drivers = drivers
+        self._list = [drivers[k] for k in sorted(drivers)]
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if self._version is not None and now - self._checked_at < self.check_interval:
+                return
+            with self.session_factory() as db:
+                version, live_version = _read_versions(db)
+                if version != self._version:
+                    self._reload(db, version)
+                elif live_version != self._live_version:
+                    self._reload_live(db)
+                self._live_version = live_version
+            self._checked_at = now
+
+    def all(self) -> List[dict]:
+        """All drivers ordered by id. The returned dicts are shared; do not mutate."""
+        self._ensure_fresh()
+        return self._list
+
+    def get(self, driver_id: int) -> Optional[dict]:
+        self._ensure_fresh()
+        driver = self._drivers.get(driver_id)
+        return dict(driver) if driver else None
+
+    def version(self) -> Optional[int]:
+        """Shared version of the driver records, excluding live fields."""
+        self._ensure_fresh()
+        return self._version
+
+    def live_version(self) -> Optional[int]:
+        self._ensure_fresh()
+        return self._live_version
+
+    # --- writes ---
+
+    def _commit_write(self, db: Session, driver_id: int, dp: Optional[DriverProfile]):
+        _bump_version(db)
+        db.commit()
+        with self._lock:
+            drivers = dict(self._drivers)
+            if dp is None:
+                drivers.pop(driver_id, None)
+            else:
+                drivers[driver_id] = to_dict(dp)
+            self._drivers = drivers
+            self._list = [drivers[k] for k in sorted(drivers)]
+            # Our own write: adopt the new version without a full reload
+            version = _read_version(db)
+            if self._version is not None and version == self._version + 1:
+                self._version = version
+            else:
+                self._version = None
+            self._notify({driver_id: drivers.get(driver_id)})
+
+    def create(self, data: dict) -> dict:
+        values = dict(NEW_DRIVER_DEFAULTS)
+        values.update({k: v for k, v in data.items() if v is not None})
+        with self.session_factory() as db:
+            dp = DriverProfile(user_id=data.get("user_id") or 0, updated_at=datetime.utcnow(), **_columns(values))
+            db.add(dp)
+            db.flush()
+            self._commit_write(db, dp.id, dp)
+            return to_dict(dp)
+
+    def update(self, driver_id: int, data: dict) -> Optional[dict]:
+        with self.session_factory() as db:
+            dp = db.get(DriverProfile, driver_id)
+            if not dp:
+                return None
+            for column, value in _columns(data).items():
+                setattr(dp, column, value)
+            dp.updated_at = datetime.utcnow()
+            self._commit_write(db, driver_id, dp)
+            return to_dict(dp)
+
+    def delete(self, driver_id: int) -> bool:
+        with self.session_factory() as db:
+            dp = db.get(DriverProfile, driver_id)
+            if not dp:
+                return False
+            db.delete(dp)
+            self._commit_write(db, driver_id, None)
+            return True
+
+    def update_live(self, values: Dict[int, dict]):
+        """
+        Persist high-frequency live fields (score, ear, mar, ...) for many
+        drivers in one transaction. This bumps the live version, not the
+        drivers version, so other workers re-read only the live columns on
+        their next check; live views also get them from the push channel.
+        """
+        table = DriverProfile.__table__
+        # Group drivers by which columns they update so each group is one executemany UPDATE
+        groups: Dict[tuple, list] = {}
+        for driver_id, fields in values.items():
+            cols = _columns(fields)
+            if cols:
+                params = {"_id": driver_id, **{f"v_{c}": v for c, v in cols.items()}}
+                groups.setdefault(tuple(sorted(cols)), []).append(params)
+        if not groups:
+            return
+        with self.session_factory() as db:
+            for cols, params in groups.items():
+                stmt = (
+                    update(table)
+                    .where(table.c.id == bindparam("_id"))
+                    .values({c: bindparam(f"v_{c}") for c in cols})
+                )
+                db.execute(stmt, params)
+            _bump_version(db, LIVE_CACHE_NAME)
+            db.commit()
+            live_version = _read_version(db, LIVE_CACHE_NAME)
+        changed = {}
+        with self._lock:
+            # Our own write: adopt the new live version unless another worker wrote in between
+            if self._live_version is not None and live_version == self._live_version + 1:
+                self._live_version = live_version
+            else:
+                self._checked_at = 0.0
+            for driver_id, fields in values.items():
+                driver = self._drivers.get(driver_id)
+                if driver is not None:
+                    driver = {**driver, **{k: v for k, v in fields.items() if k in FIELD_COLUMNS}}
+                    if driver.get("score") is not None:
+                        driver["score"] = int(round(driver["score"]))
+                    changed[driver_id] = driver
+            if changed:
+                self._swap_in(changed)
+                self._notify(changed)
+
+    def on_ingest(self, rows: List[dict], ids: List[int]):
+        """Ingest listener: keep each driver's ear/mar at the latest sample, throttled per driver."""
+        latest: Dict[int, tuple] = {}
+        for row in rows:
+            driver_id = row.get("driver_id")
+            fields = {f: row[f] for f in ("ear", "mar") if row.get(f) is not None}
+            if driver_id is None or not fields:
+                continue
+            ts = row.get("timestamp") or datetime.utcnow()
+            seen = latest.get(driver_id)
+            if seen is None or ts >= seen[0]:
+                latest[driver_id] = (ts, {**(seen[1] if seen else {}), **fields})
+        if not latest:
+            return
+        self._ensure_fresh()
+        now = time.monotonic()
+        with self._lock:
+            due = {
+                d: fields for d, (_, fields) in latest.items()
+                if d in self._drivers and now - self._live_written.get(d, 0.0) >= DRIVER_LIVE_WRITE_S
+            }
+            self._live_written.update({d: now for d in due})
+        if due:
+            self.update_live(due)
+
+    def seed(self, drivers: Dict[int, dict]):
+        # Load the bundled demo drivers into an empty table, keeping their ids
+        with self.session_factory() as db:
+            if db.scalar(select(DriverProfile.id).limit(1)) is not None:
+                return
+            for driver_id, data in drivers.items():
+                db.add(DriverProfile(id=driver_id, user_id=0, updated_at=datetime.utcnow(), **_columns(data)))
+            db.flush()
+            if db.get_bind().dialect.name == "postgresql":
+                # Explicit ids don't advance the serial sequence; move it past them for create()
+                db.execute(text("SELECT setval(pg_get_serial_sequence('drivers', 'id'), (SELECT max(id) FROM drivers))"))
+            _bump_version(db)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another worker seeded first
+                db.rollback()
+        self._version = None
+
+    def stats(self) -> dict:
+        return {"drivers": len(self._drivers), "version": self._version, "reloads": self.reloads}
+
+
+registry = DriverRegistry()
+telemetry.add_listener(registry.on_ingest)
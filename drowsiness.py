@@ -0,0 +1,185 @@
+# drowsiness.py
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional
+
+import log_writer
+import telemetry
+
+EAR_CLOSED_THRESHOLD = float(os.environ.get("EAR_CLOSED_THRESHOLD", "0.21"))
+# Consecutive closed-eye samples before an eyes-closed alert
+EYES_CLOSED_FRAMES = int(os.environ.get("EYES_CLOSED_FRAMES", "15"))
+# PERCLOS: fraction of the last PERCLOS_WINDOW samples with eyes closed
+PERCLOS_WINDOW = int(os.environ.get("PERCLOS_WINDOW", "90"))
+PERCLOS_THRESHOLD = float(os.environ.get("PERCLOS_THRESHOLD", "0.4"))
+MAR_YAWN_THRESHOLD = float(os.environ.get("MAR_YAWN_THRESHOLD", "0.6"))
+# Consecutive open-mouth samples that count as one yawn
+YAWN_MIN_FRAMES = int(os.environ.get("YAWN_MIN_FRAMES", "10"))
+# YAWN_RATE_COUNT yawns within YAWN_WINDOW_S seconds raise a yawning alert
+YAWN_RATE_COUNT = int(os.environ.get("YAWN_RATE_COUNT", "3"))
+YAWN_WINDOW_S = float(os.environ.get("YAWN_WINDOW_S", "300"))
+# Minimum gap between two alerts of the same kind for one driver
+ALERT_COOLDOWN_S = float(os.environ.get("ALERT_COOLDOWN_S", "30"))
+# Least recently seen drivers are dropped beyond this, bounding memory
+MAX_TRACKED_DRIVERS = int(os.environ.get("MAX_TRACKED_DRIVERS", "20000"))
+
+ALERT_EYES_CLOSED = "alert_eyes_closed"
+ALERT_PERCLOS = "alert_perclos"
+ALERT_YAWNING = "alert_yawning"
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _seconds(ts) -> float:
+    return (ts - _EPOCH).total_seconds() if isinstance(ts, datetime) else float(ts)
+
+
+def _number(value) -> Optional[float]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value != value:
+        return None
+    return float(value)
+
+
+class DriverWindow:
+    """Sliding-window state for one driver; every update is O(1)."""
+
+    __slots__ = ("closed", "pos", "filled", "closed_sum", "closed_run", "mouth_run", "yawns", "last_alert")
+
+    def __init__(self, window: int):
+        self.closed = bytearray(window)  # ring buffer of 0/1 closed-eye flags
+        self.pos = 0
+        self.filled = 0
+        self.closed_sum = 0
+        self.closed_run = 0
+        self.mouth_run = 0
+        self.yawns: List[float] = []  # onset times of the last YAWN_RATE_COUNT yawns
+        self.last_alert: Optional[dict] = None
+
+    def push_eye(self, closed: bool):
+        flag = 1 if closed else 0
+        self.closed_sum += flag - self.closed[self.pos]
+        self.closed[self.pos] = flag
+        self.pos = (self.pos + 1) % len(self.closed)
+        if self.filled < len(self.closed):
+            self.filled += 1
+        self.closed_run = self.closed_run + 1 if closed else 0
+
+    @property
+    def perclos(self) -> float:
+        return self.closed_sum / self.filled if self.filled else 0.0
+
+
+class DrowsinessDetector:
+    """
+    Consumes ingested EAR/MAR samples and raises alerts for long eye
+    closures, high PERCLOS and frequent yawning. Alerts are written as
+    alert_* log events, which also pushes them to live subscribers.
+    """
+
+    def __init__(self, max_drivers: int = MAX_TRACKED_DRIVERS, window: int = PERCLOS_WINDOW):
+        self.max_drivers = max_drivers
+        self.window = window
+        self.drivers: "OrderedDict[int, DriverWindow]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.samples = 0
+        self.alerts = 0
+        self.dropped_alerts = 0
+        self.evicted = 0
+
+    def _state(self, driver_id: int) -> DriverWindow:
+        state = self.drivers.get(driver_id)
+        if state is None:
+            state = self.drivers[driver_id] = DriverWindow(self.window)
+            if len(self.drivers) > self.max_drivers:
+                self.drivers.popitem(last=False)
+                self.evicted += 1
+        else:
+            self.drivers.move_to_end(driver_id)
+        return state
+
+    def _alert(self, out: List[dict], state: DriverWindow, driver_id: int, now: float, ts,
+               kind: str, severity: str, message: str, value: float, threshold: float):
+        if state.last_alert is None:
+            state.last_alert = {}
+        last = state.last_alert.get(kind)
+        if last is not None and now - last < ALERT_COOLDOWN_S:
+            return
+        state.last_alert[kind] = now
+        out.append({
+            "driver_id": driver_id,
+            "event_type": kind,
+            "data": telemetry.encode_data({
+                "severity": severity, "message": message,
+                "value": round(value, 4), "threshold": threshold,
+            }),
+            "timestamp": ts,
+        })
+
+    def process(self, driver_id: int, ear: Optional[float], mar: Optional[float], ts) -> List[dict]:
+        """Feed one sample; returns alert rows (not yet written)."""
+        out: List[dict] = []
+        now = _seconds(ts)
+        state = self._state(driver_id)
+        self.samples += 1
+        if ear is not None:
+            state.push_eye(ear < EAR_CLOSED_THRESHOLD)
+            if state.closed_run == EYES_CLOSED_FRAMES:
+                self._alert(out, state, driver_id, now, ts, ALERT_EYES_CLOSED, "high",
+                            f"Eyes closed for {state.closed_run} frames", ear, EAR_CLOSED_THRESHOLD)
+            if state.filled >= self.window and state.perclos >= PERCLOS_THRESHOLD:
+                self._alert(out, state, driver_id, now, ts, ALERT_PERCLOS, "medium",
+                            f"PERCLOS {state.perclos:.0%} over last {self.window} samples",
+                            state.perclos, PERCLOS_THRESHOLD)
+        if mar is not None:
+            if mar > MAR_YAWN_THRESHOLD:
+                state.mouth_run += 1
+                if state.mouth_run == YAWN_MIN_FRAMES:
+                    state.yawns.append(now)
+                    if len(state.yawns) > YAWN_RATE_COUNT:
+                        del state.yawns[0]
+                    if len(state.yawns) >= YAWN_RATE_COUNT and now - state.yawns[0] <= YAWN_WINDOW_S:
+                        self._alert(out, state, driver_id, now, ts, ALERT_YAWNING, "medium",
+                                    f"{len(state.yawns)} yawns in {int(now - state.yawns[0])}s",
+                                    float(len(state.yawns)), float(YAWN_RATE_COUNT))
+            else:
+                state.mouth_run = 0
+        return out
+
+    def on_ingest(self, rows: List[dict], ids: List[int]):
+        alerts: List[dict] = []
+        with self._lock:
+            for row in rows:
+                driver_id = row.get("driver_id")
+                if driver_id is None or str(row.get("event_type", "")).startswith("alert"):
+                    continue
+                ear, mar = _number(row.get("ear")), _number(row.get("mar"))
+                if ear is None and mar is None:
+                    continue
+                alerts.extend(self.process(driver_id, ear, mar, row.get("timestamp") or datetime.utcnow()))
+            self.alerts += len(alerts)
+        if alerts:
+            self._emit(alerts)
+
+    def _emit(self, alerts: List[dict]):
+        for row in alerts:
+            try:
+                log_writer.writer.submit(row)
+            except log_writer.WriterFull:
+                self.dropped_alerts += 1
+
+    def stats(self) -> dict:
+        return {
+            "tracked_drivers": len(self.drivers),
+            "max_drivers": self.max_drivers,
+            "window": self.window,
+            "samples": self.samples,
+            "alerts": self.alerts,
+            "dropped_alerts": self.dropped_alerts,
+            "evicted": self.evicted,
+        }
+
+
+detector = DrowsinessDetector()
+telemetry.add_listener(detector.on_ingest)
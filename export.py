@@ -0,0 +1,256 @@
+# export.py
+import argparse
+import csv
+import heapq
+import io
+import json
+import os
+import sys
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import log_query
+import retention
+from database import SessionLocal
+from models import LogEntry
+
+# Rows fetched from the database cursor and written out per batch / row group
+EXPORT_BATCH_ROWS = int(os.environ.get("EXPORT_BATCH_ROWS", "5000"))
+
+FORMATS = ("csv", "parquet")
+MEDIA_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+COLUMNS = ("id", "driver_id", "event_type", "timestamp", "ear", "mar", "speed", "confidence", "data")
+# First field of the resume marker rows between CSV batches (see csv_marker)
+MARKER = "#cursor"
+
+
+class ExportUnavailable(RuntimeError):
+    pass
+
+
+def _iter_rows(db: Session, stmt) -> Iterator[tuple]:
+    for partition in db.execute(stmt).partitions():
+        yield from partition
+
+
+def iter_batches(db: Session, cursor: Optional[str] = None, batch_size: int = EXPORT_BATCH_ROWS,
+                 **filters) -> Iterator[List[tuple]]:
+    """
+    Oldest-first batches of log rows as tuples in COLUMNS order, streamed
+    from server-side cursors on the hot table and any archived months in
+    range, merged on (timestamp, id). The resume token for everything up
+    to a row is log_query.encode_cursor(row timestamp, row id).
+    """
+    stmt = log_query.filtered(select(*(getattr(LogEntry, c) for c in COLUMNS)), **filters)
+    stmt = log_query.after_cursor(stmt, cursor, descending=False)
+    stmt = stmt.order_by(LogEntry.timestamp, LogEntry.id).execution_options(yield_per=batch_size)
+    with ExitStack() as stack:
+        sources = [_iter_rows(db, stmt)]
+        for part in retention.partitions_for(db, filters.get("start"), filters.get("end")):
+            pdb = stack.enter_context(retention.partition_session(part))
+            sources.append(_iter_rows(pdb, stmt))
+        rows = heapq.merge(*sources, key=lambda r: (r[3], r[0])) if len(sources) > 1 else sources[0]
+        batch: List[tuple] = []
+        for row in rows:
+            batch.append(tuple(row))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def resume_token(batch: List[tuple]) -> str:
+    last = batch[-1]
+    return log_query.encode_cursor(last[3], last[0])
+
+
+# --- CSV ---
+
+def csv_header() -> bytes:
+    buf = io.StringIO()
+    csv.writer(buf).writerow(COLUMNS)
+    return buf.getvalue().encode()
+
+
+def csv_chunk(batch: List[tuple]) -> bytes:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerows(
+        (log_id, driver_id, event_type, ts.isoformat() if ts else "", ear, mar, speed, confidence, data)
+        for log_id, driver_id, event_type, ts, ear, mar, speed, confidence, data in batch
+    )
+    return buf.getvalue().encode()
+
+
+def csv_marker(batch: List[tuple]) -> bytes:
+    """
+    '#cursor,<token>' row written after a batch: to resume a broken
+    download, keep the file up to the last marker and request ?cursor=<token>.
+    Readers skip it as a comment (pandas comment='#') or by its first field.
+    """
+    buf = io.StringIO()
+    csv.writer(buf).writerow((MARKER, resume_token(batch)))
+    return buf.getvalue().encode()
+
+
+# --- Parquet (optional, needs pyarrow) ---
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ExportUnavailable("Parquet export needs pyarrow installed")
+    return pyarrow
+
+
+def parquet_schema():
+    pa = _pyarrow()
+    return pa.schema([
+        ("id", pa.int64()),
+        ("driver_id", pa.int64()),
+        ("event_type", pa.string()),
+        ("timestamp", pa.timestamp("us")),
+        ("ear", pa.float64()),
+        ("mar", pa.float64()),
+        ("speed", pa.float64()),
+        ("confidence", pa.float64()),
+        ("data", pa.string()),
+    ])
+
+
+def parquet_table(batch: List[tuple], schema):
+    pa = _pyarrow()
+    columns = list(zip(*batch))
+    return pa.Table.from_arrays(
+        [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema
+    )
+
+
+class _ChunkSink:
+    """Write-only file object collecting what the Parquet writer emits, drained per row group."""
+
+    closed = False
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def write(self, data) -> int:
+        chunk = bytes(data)
+        self.chunks.append(chunk)
+        self.position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        out, self.chunks = b"".join(self.chunks), []
+        return out
+
+
+# --- streaming ---
+
+def stream(fmt: str, cursor: Optional[str] = None, batch_size: int = EXPORT_BATCH_ROWS,
+           session_factory=SessionLocal, markers: bool = False, **filters) -> Iterator[bytes]:
+    """
+    Encoded export bytes, one chunk per batch, for a StreamingResponse or a
+    file. Holds one batch in memory at a time whatever the row count. With
+    markers=True each CSV batch ends with a resume marker row (csv_marker).
+    """
+    if fmt == "parquet":
+        schema = parquet_schema()
+    with session_factory() as db:
+        if fmt == "csv":
+            if not cursor:
+                yield csv_header()
+            for batch in iter_batches(db, cursor, batch_size, **filters):
+                yield csv_chunk(batch) + (csv_marker(batch) if markers else b"")
+            return
+        pq = _pyarrow().parquet
+        sink = _ChunkSink()
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        for batch in iter_batches(db, cursor, batch_size, **filters):
+            writer.write_table(parquet_table(batch, schema), row_group_size=batch_size)
+            yield sink.drain()
+        writer.close()
+        yield sink.drain()
+
+
+def export_to_file(path: str, fmt: str, resume: bool = False, cursor: Optional[str] = None,
+                   batch_size: int = EXPORT_BATCH_ROWS, **filters) -> int:
+    """
+    Write an export to path, keeping a path + '.cursor' checkpoint after
+    every batch. With resume=True a CSV export continues from the last
+    checkpoint. Returns the number of rows written in this run.
+    """
+    checkpoint = path + ".cursor"
+    offset = 0
+    if resume:
+        if fmt != "csv":
+            raise ValueError("Only CSV exports can be resumed in place; pass --cursor with a new file instead")
+        if os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                state = json.load(f)
+            cursor, offset = state["cursor"], state["offset"]
+    rows = 0
+    with SessionLocal() as db, open(path, "r+b" if resume and offset else "wb") as out:
+        out.seek(offset)
+        out.truncate()
+        writer = None
+        if fmt == "csv" and not cursor:
+            out.write(csv_header())
+        elif fmt == "parquet":
+            schema = parquet_schema()
+            writer = _pyarrow().parquet.ParquetWriter(out, schema, compression="zstd")
+        for batch in iter_batches(db, cursor, batch_size, **filters):
+            if writer is not None:
+                writer.write_table(parquet_table(batch, schema), row_group_size=batch_size)
+            else:
+                out.write(csv_chunk(batch))
+            out.flush()
+            rows += len(batch)
+            with open(checkpoint, "w") as f:
+                json.dump({"cursor": resume_token(batch), "offset": out.tell(), "rows": rows}, f)
+        if writer is not None:
+            writer.close()
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export driver logs to CSV or Parquet")
+    parser.add_argument("out", help="output file")
+    parser.add_argument("--format", choices=FORMATS, default=None, help="default: from the file extension")
+    parser.add_argument("--driver-id", type=int, default=None)
+    parser.add_argument("--event-type", default=None)
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None, help="ISO timestamp (UTC)")
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None, help="ISO timestamp (UTC), exclusive")
+    parser.add_argument("--cursor", default=None, help="start after this resume token")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted CSV export")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_ROWS)
+    args = parser.parse_args()
+    fmt = args.format or ("parquet" if args.out.endswith(".parquet") else "csv")
+    try:
+        count = export_to_file(
+            args.out, fmt, resume=args.resume, cursor=args.cursor, batch_size=args.batch_size,
+            driver_id=args.driver_id, event_type=args.event_type, start=args.start, end=args.end,
+        )
+    except (ExportUnavailable, ValueError) as e:
+        print(f"Export Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        hint = "rerun with --resume" if fmt == "csv" else "pass its cursor with --cursor to export the rest"
+        print(f"Interrupted; checkpoint in {args.out}.cursor, {hint}", file=sys.stderr)
+        sys.exit(130)
+    print(f"Exported {count} rows to {args.out}")
@@ -0,0 +1,307 @@
+# faces.py
+# Face-embedding index for driver identity checks. Embeddings live
+# L2-normalized in one contiguous float32 matrix memory-mapped from disk,
+# with a parallel int64 array of driver ids; rows [0, count) are live and
+# removal moves the last row into the hole, so search is one matrix product
+# over a dense block with no per-driver Python objects.
+#
+#   FACE_INDEX_DIR/embeddings.f32   capacity x dim float32
+#   FACE_INDEX_DIR/ids.i64          capacity int64 driver ids
+#   FACE_INDEX_DIR/meta.json        dim, count, capacity, generation
+#
+# Several worker processes can share the files: writers hold a file lock
+# and bump the generation, readers re-map when meta.json changes.
+import argparse
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+FACE_INDEX_DIR = os.environ.get("FACE_INDEX_DIR", "./faces")
+FACE_EMBEDDING_DIM = int(os.environ.get("FACE_EMBEDDING_DIM", "128"))
+# Cosine similarity at or above which a probe counts as the same person
+FACE_MATCH_THRESHOLD = float(os.environ.get("FACE_MATCH_THRESHOLD", "0.6"))
+FACE_TOP_K = int(os.environ.get("FACE_TOP_K", "5"))
+INITIAL_CAPACITY = 1024
+
+
+class FaceError(ValueError):
+    pass
+
+
+def normalize(embeddings, dim: int) -> np.ndarray:
+    """(n, dim) or (dim,) numbers -> (n, dim) unit-length float32 rows."""
+    try:
+        arr = np.asarray(embeddings, dtype=np.float32)
+    except (TypeError, ValueError) as e:
+        raise FaceError(f"Embedding must be a list of numbers: {e}")
+    if arr.ndim == 1:
+        arr = arr[None, :]
+    if arr.ndim != 2 or arr.shape[1] != dim:
+        raise FaceError(f"Expected embeddings of length {dim}, got shape {arr.shape}")
+    if not np.isfinite(arr).all():
+        raise FaceError("Embedding contains NaN or infinite values")
+    norms = np.linalg.norm(arr, axis=1, keepdims=True)
+    if (norms == 0).any():
+        raise FaceError("Embedding has zero length")
+    return arr / norms
+
+
+class FaceIndex:
+    def __init__(self, directory: str = FACE_INDEX_DIR, dim: int = FACE_EMBEDDING_DIM):
+        self.directory = directory
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._vectors: Optional[np.memmap] = None
+        self._ids: Optional[np.memmap] = None
+        self._meta_stamp = None
+        self.count = 0
+        self.capacity = 0
+        self.generation = 0
+        self.searches = 0
+
+    # --- files ---
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @contextmanager
+    def _file_lock(self):
+        # Serialize writers across worker processes (no-op where fcntl is unavailable)
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path("index.lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _map(self, capacity: int, grow: bool = False):
+        # Only writers (under the file lock) may create or extend the files
+        for name, dtype, width in (("embeddings.f32", np.float32, self.dim), ("ids.i64", np.int64, 1)) if grow else ():
+            path = self._path(name)
+            size = capacity * width * np.dtype(dtype).itemsize
+            with open(path, "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+        self._vectors = np.memmap(self._path("embeddings.f32"), dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._ids = np.memmap(self._path("ids.i64"), dtype=np.int64, mode="r+", shape=(capacity,))
+        self.capacity = capacity
+
+    def _write_meta(self):
+        self.generation += 1
+        tmp = self._path("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"dim": self.dim, "count": self.count, "capacity": self.capacity,
+                       "generation": self.generation}, f)
+        os.replace(tmp, self._path("meta.json"))
+        self._meta_stamp = self._stamp()
+
+    def _stamp(self):
+        # meta.json is replaced on every write, so a new inode means a change even within one mtime tick
+        try:
+            st = os.stat(self._path("meta.json"))
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def _refresh(self, create: bool = False):
+        """
+        Open the index on first use and re-map it when another process
+        changed it. A missing index reads as empty; only writers, holding
+        the file lock, pass create=True to initialize it.
+        """
+        stamp = self._stamp()
+        if self._vectors is not None and stamp == self._meta_stamp:
+            return
+        if stamp is None:
+            self.count, self.generation = 0, 0
+            self._vectors = self._ids = self._meta_stamp = None
+            if create:
+                os.makedirs(self.directory, exist_ok=True)
+                self._map(INITIAL_CAPACITY, grow=True)
+                self._write_meta()
+            return
+        with open(self._path("meta.json")) as f:
+            meta = json.load(f)
+        if meta["dim"] != self.dim:
+            raise FaceError(f"Index at {self.directory} holds {meta['dim']}-d embeddings, configured for {self.dim}")
+        self.count, self.generation = meta["count"], meta["generation"]
+        self._map(meta["capacity"])
+        self._meta_stamp = stamp
+
+    def _slot(self, driver_id: int) -> Optional[int]:
+        if not self.count:
+            return None
+        hits = np.flatnonzero(self._ids[:self.count] == driver_id)
+        return int(hits[0]) if hits.size else None
+
+    # --- writes ---
+
+    def enroll(self, driver_id: int, embedding) -> int:
+        """Store (or replace) a driver's embedding. Returns the number of enrolled drivers."""
+        return self.enroll_many([driver_id], embedding)
+
+    def enroll_many(self, driver_ids: List[int], embeddings) -> int:
+        """Store (or replace) embeddings for many drivers in one locked write."""
+        vectors = normalize(embeddings, self.dim)
+        if len(vectors) != len(driver_ids):
+            raise FaceError(f"Got {len(vectors)} embeddings for {len(driver_ids)} drivers")
+        if len(set(driver_ids)) != len(driver_ids):
+            raise FaceError("Duplicate driver ids in one enrollment")
+        with self._lock, self._file_lock():
+            self._refresh(create=True)
+            ids = np.asarray(driver_ids, dtype=np.int64)
+            slots = np.empty(len(ids), dtype=np.int64)
+            known = np.zeros(len(ids), dtype=bool)
+            if self.count:
+                # Find already enrolled drivers with one sort instead of a scan per id
+                order = np.argsort(self._ids[:self.count])
+                pos = np.minimum(np.searchsorted(self._ids[:self.count][order], ids), self.count - 1)
+                known = self._ids[:self.count][order][pos] == ids
+                slots[known] = order[pos[known]]
+            fresh = int((~known).sum())
+            if self.count + fresh > self.capacity:
+                self._vectors.flush()
+                self._ids.flush()
+                capacity = self.capacity
+                while capacity < self.count + fresh:
+                    capacity *= 2
+                self._map(capacity, grow=True)
+            slots[~known] = np.arange(self.count, self.count + fresh)
+            self.count += fresh
+            self._vectors[slots] = vectors
+            self._ids[slots] = ids
+            self._vectors.flush()
+            self._ids.flush()
+            self._write_meta()
+            return self.count
+
+    def remove(self, driver_id: int) -> bool:
+        with self._lock, self._file_lock():
+            self._refresh()
+            slot = self._slot(driver_id)
+            if slot is None:
+                return False
+            last = self.count - 1
+            if slot != last:
+                # Keep rows [0, count) dense: move the last row into the hole
+                self._vectors[slot] = self._vectors[last]
+                self._ids[slot] = self._ids[last]
+            self._ids[last] = 0
+            self.count = last
+            self._vectors.flush()
+            self._ids.flush()
+            self._write_meta()
+            return True
+
+    # --- reads ---
+
+    def search(self, queries, k: int = FACE_TOP_K) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k enrolled drivers for each query by cosine similarity.
+        Returns (driver_ids, scores), both shaped (queries, min(k, count)),
+        best first.
+        """
+        q = normalize(queries, self.dim)
+        with self._lock:
+            self._refresh()
+            # A remap swaps in new arrays; these references stay valid for this search
+            n, vectors, all_ids = self.count, self._vectors, self._ids
+        if n == 0:
+            return np.empty((len(q), 0), dtype=np.int64), np.empty((len(q), 0), dtype=np.float32)
+        scores = q @ vectors[:n].T  # (queries, n)
+        ids = np.asarray(all_ids[:n])
+        self.searches += len(q)
+        k = min(k, n)
+        if k < n:
+            top = np.argpartition(scores, n - k, axis=1)[:, n - k:]
+        else:
+            top = np.broadcast_to(np.arange(n), (len(q), n))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        return ids[top], np.take_along_axis(top_scores, order, axis=1)
+
+    def verify(self, driver_id: int, embedding, threshold: float = FACE_MATCH_THRESHOLD,
+               k: int = FACE_TOP_K) -> Optional[dict]:
+        """
+        Check a probe against the claimed driver and the whole fleet. Verified
+        when the claimed driver scores at least threshold and no other
+        enrolled driver scores higher. None if the driver is not enrolled.
+        """
+        q = normalize(embedding, self.dim)
+        with self._lock:
+            self._refresh()
+            slot = self._slot(driver_id)
+            if slot is None:
+                return None
+            score = float(self._vectors[slot] @ q[0])
+        ids, scores = self.search(q, k)
+        candidates = [{"driver_id": int(i), "score": round(float(s), 4)} for i, s in zip(ids[0], scores[0])]
+        best = candidates[0] if candidates else None
+        # Ties with another driver still count for the claimed one
+        verified = score >= threshold and (not candidates or int(ids[0][0]) == driver_id or float(scores[0][0]) <= score)
+        return {"driver_id": driver_id, "verified": verified, "score": round(score, 4),
+                "threshold": threshold, "best_match": best, "candidates": candidates}
+
+    def __contains__(self, driver_id: int) -> bool:
+        with self._lock:
+            self._refresh()
+            return self._slot(driver_id) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self.count
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refresh()
+            return {"enrolled": self.count, "capacity": self.capacity, "dim": self.dim,
+                    "generation": self.generation, "searches": self.searches,
+                    "bytes": self.capacity * self.dim * 4}
+
+
+_index: Optional[FaceIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> FaceIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = FaceIndex()
+    return _index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or seed the face-embedding index")
+    parser.add_argument("--seed", type=int, default=0, help="enroll this many random drivers (ids 1..N) for testing")
+    parser.add_argument("--search", action="store_true", help="time a random single-probe search")
+    args = parser.parse_args()
+    index = get_index()
+    if args.seed:
+        rng = np.random.default_rng(0)
+        started = time.perf_counter()
+        for first in range(1, args.seed + 1, 10000):
+            batch = list(range(first, min(first + 10000, args.seed + 1)))
+            index.enroll_many(batch, rng.standard_normal((len(batch), index.dim)))
+        print(f"Enrolled {args.seed} drivers in {time.perf_counter() - started:.1f}s")
+    if args.search:
+        probe: List[float] = np.random.default_rng(1).standard_normal(index.dim).tolist()
+        index.search(probe)
+        started = time.perf_counter()
+        index.search(probe)
+        print(f"Search over {len(index)} faces: {(time.perf_counter() - started) * 1000:.2f} ms")
+    print(json.dumps(index.stats()))
@@ -0,0 +1,211 @@
+# fleet.py
+import heapq
+import itertools
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+
+import drivers
+import live
+from database import SessionLocal
+from models import LogRollup
+
+ALERT_WINDOW_MIN = 60
+# The alert count is re-read from the shared minute rollups at most this often
+FLEET_ALERTS_TTL_S = float(os.environ.get("FLEET_ALERTS_TTL_S", "1"))
+FLEET_TOP_N = int(os.environ.get("FLEET_TOP_N", "5"))
+FLEET_TOP_N_MAX = int(os.environ.get("FLEET_TOP_N_MAX", "50"))
+# How often the summary is checked and, when it changed, pushed to live subscribers
+FLEET_PUSH_INTERVAL_S = float(os.environ.get("FLEET_PUSH_INTERVAL_S", "1"))
+
+def status_kind(status: Optional[str]) -> str:
+    text = (status or "").lower()
+    if "rest" in text:
+        return "resting"
+    if text.startswith("active") or text in ("online", "driving"):
+        return "active"
+    return "other"
+
+
+def _number(value) -> Optional[float]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value != value:
+        return None
+    return float(value)
+
+
+class FleetSummary:
+    """
+    Fleet-level figures kept up to date from driver registry changes, so
+    reading them costs the same however large the fleet is. Everything comes
+    from shared state (the drivers table and the minute rollups), so every
+    worker answers the same. Riskiest drivers come from a min-heap on
+    (score, id) with lazy invalidation.
+    While live subscribers are connected, a background thread pushes the
+    summary to them as a 'fleet' message whenever it changes.
+    """
+
+    def __init__(self, push_interval: float = FLEET_PUSH_INTERVAL_S, session_factory=SessionLocal):
+        self.push_interval = push_interval
+        self.session_factory = session_factory
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.pushes = 0
+        self._lock = threading.Lock()
+        self._drivers: Dict[int, dict] = {}
+        self._state: Dict[int, Tuple[str, Optional[float], Optional[float]]] = {}  # kind, score, ear
+        self._counts = {"active": 0, "resting": 0, "other": 0}
+        self._score_sum = 0.0
+        self._score_n = 0
+        self._ear_sum = 0.0
+        self._ear_n = 0
+        self._heap: List[Tuple[float, int, int]] = []  # (score, driver_id, seq)
+        self._heap_seq: Dict[int, int] = {}
+        self._seq = itertools.count()
+        self.alerts_last_hour = 0
+        self._alerts_at = 0.0
+
+    # --- maintenance ---
+
+    def _apply(self, driver_id: int, driver: Optional[dict]):
+        old = self._state.pop(driver_id, None)
+        if old is not None:
+            kind, score, ear = old
+            self._counts[kind] -= 1
+            if score is not None:
+                self._score_sum -= score
+                self._score_n -= 1
+            if ear is not None:
+                self._ear_sum -= ear
+                self._ear_n -= 1
+        if driver is None:
+            self._drivers.pop(driver_id, None)
+            self._heap_seq.pop(driver_id, None)
+            return
+        kind = status_kind(driver.get("status"))
+        score = _number(driver.get("score"))
+        ear = _number(driver.get("ear"))
+        self._drivers[driver_id] = driver
+        self._state[driver_id] = (kind, score, ear)
+        self._counts[kind] += 1
+        if score is not None:
+            self._score_sum += score
+            self._score_n += 1
+            if old is None or old[1] != score or driver_id not in self._heap_seq:
+                seq = next(self._seq)
+                self._heap_seq[driver_id] = seq
+                heapq.heappush(self._heap, (score, driver_id, seq))
+        else:
+            self._heap_seq.pop(driver_id, None)
+        if ear is not None:
+            self._ear_sum += ear
+            self._ear_n += 1
+        self._compact()
+
+    def _compact(self):
+        # Stale heap entries are skipped lazily; rebuild once they dominate
+        if len(self._heap) > 2 * len(self._heap_seq) + 64:
+            self._heap = [e for e in self._heap if self._heap_seq.get(e[1]) == e[2]]
+            heapq.heapify(self._heap)
+
+    def on_drivers_changed(self, changed: Dict[int, Optional[dict]], reset: bool):
+        with self._lock:
+            if reset:
+                for driver_id in list(self._state):
+                    if driver_id not in changed:
+                        self._apply(driver_id, None)
+            for driver_id, driver in changed.items():
+                self._apply(driver_id, driver)
+
+    def load_alerts(self, db):
+        """Alerts in the last ALERT_WINDOW_MIN minutes, summed from the minute rollups."""
+        since = datetime.utcnow().replace(second=0, microsecond=0) - timedelta(minutes=ALERT_WINDOW_MIN - 1)
+        total = db.scalar(
+            select(func.coalesce(func.sum(LogRollup.count), 0))
+            .where(LogRollup.resolution == "minute", LogRollup.bucket >= since,
+                   LogRollup.event_type.like("alert%"))
+        )
+        self.alerts_last_hour = int(total or 0)
+        self._alerts_at = time.monotonic()
+
+    def _alerts(self) -> int:
+        if time.monotonic() - self._alerts_at >= FLEET_ALERTS_TTL_S:
+            with self.session_factory() as db:
+                self.load_alerts(db)
+        return self.alerts_last_hour
+
+    def start(self):
+        with self.session_factory() as db:
+            self.load_alerts(db)
+        drivers.registry.version()
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="fleet-push", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+            self._thread = None
+
+    def _run(self):
+        last = None
+        while not self._stop.wait(self.push_interval):
+            if not live.broker.subscribers:
+                last = None
+                continue
+            try:
+                # summary() also picks up other workers' driver changes and re-reads the alert count
+                summary = self.summary()
+                if summary != last:
+                    live.broker.publish([{"type": "fleet", "driver_id": None, **summary}])
+                    self.pushes += 1
+                    last = summary
+            except Exception as e:
+                print(f"Fleet Push Error: {e}")
+
+    # --- reads ---
+
+    def riskiest(self, n: int) -> List[dict]:
+        out, valid = [], []
+        while self._heap and len(valid) < n:
+            entry = heapq.heappop(self._heap)
+            if self._heap_seq.get(entry[1]) != entry[2]:
+                continue
+            valid.append(entry)
+        for entry in valid:
+            heapq.heappush(self._heap, entry)
+            driver = self._drivers[entry[1]]
+            kind, score, ear = self._state[entry[1]]
+            out.append({
+                "id": entry[1], "name": driver.get("name"), "vehicle": driver.get("vehicle"),
+                "status": driver.get("status"), "status_color": driver.get("status_color"),
+                "score": int(round(score)), "ear": ear,
+            })
+        return out
+
+    def summary(self, top: int = FLEET_TOP_N) -> dict:
+        # Picks up driver changes made by other workers (cheap version check)
+        drivers.registry.version()
+        top = max(0, min(top, FLEET_TOP_N_MAX))
+        alerts = self._alerts()
+        with self._lock:
+            return {
+                "drivers": len(self._state),
+                "active": self._counts["active"],
+                "resting": self._counts["resting"],
+                "other": self._counts["other"],
+                "avg_score": round(self._score_sum / self._score_n, 1) if self._score_n else None,
+                "avg_ear": round(self._ear_sum / self._ear_n, 4) if self._ear_n else None,
+                "alerts_last_hour": alerts,
+                "riskiest": self.riskiest(top),
+            }
+
+
+fleet = FleetSummary()
+drivers.registry.add_listener(fleet.on_drivers_changed)
@@ -0,0 +1,110 @@
+# landmarks.py
+# Eye Aspect Ratio (EAR) and Mouth Aspect Ratio (MAR) from facial landmarks,
+# computed for whole batches of frames at once with NumPy.
+#
+# Input is an array of shape (N, P, 2) or (N, P, 3): N frames of P points, in
+# either the 68-point dlib/iBUG layout or the 468/478-point MediaPipe Face Mesh
+# layout (478 with iris refinement).
+#
+#   EAR = (|p2-p6| + |p3-p5|) / (2 |p1-p4|)                (Soukupova & Cech, 2016)
+#   MAR = (|p2-p8| + |p3-p7| + |p4-p6|) / (3 |p1-p5|)      over the inner lips
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Six points per eye in EAR order: corner, top, top, corner, bottom, bottom
+# Eight inner-lip points in MAR order: corner, top x3, corner, bottom x3 (bottom reversed)
+_LAYOUTS: Dict[int, Dict[str, Tuple[int, ...]]] = {
+    68: {
+        "left_eye": (36, 37, 38, 39, 40, 41),
+        "right_eye": (42, 43, 44, 45, 46, 47),
+        "mouth": (60, 61, 62, 63, 64, 65, 66, 67),
+    },
+    468: {
+        "left_eye": (33, 160, 158, 133, 153, 144),
+        "right_eye": (362, 385, 387, 263, 373, 380),
+        "mouth": (78, 82, 13, 312, 308, 317, 14, 87),
+    },
+}
+_LAYOUTS[478] = _LAYOUTS[468]
+_INDEX = {n: {k: np.array(v) for k, v in layout.items()} for n, layout in _LAYOUTS.items()}
+
+SUPPORTED_POINTS = tuple(sorted(_LAYOUTS))
+
+
+def as_frames(landmarks) -> np.ndarray:
+    """Validate and convert input to a float32 (N, P, D) array; a single frame (P, D) is promoted."""
+    arr = np.asarray(landmarks, dtype=np.float32)
+    if arr.ndim == 2:
+        arr = arr[np.newaxis]
+    if arr.ndim != 3 or arr.shape[2] not in (2, 3):
+        raise ValueError(f"Expected landmarks of shape (N, P, 2|3), got {arr.shape}")
+    if arr.shape[1] not in _LAYOUTS:
+        raise ValueError(f"Unsupported landmark count {arr.shape[1]}, expected one of {SUPPORTED_POINTS}")
+    return arr
+
+
+def _dist(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.sqrt(np.sum((a - b) ** 2, axis=-1))
+
+
+def _eye_ratio(eye: np.ndarray) -> np.ndarray:
+    # eye: (N, 6, D)
+    vertical = _dist(eye[:, 1], eye[:, 5]) + _dist(eye[:, 2], eye[:, 4])
+    horizontal = _dist(eye[:, 0], eye[:, 3])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = vertical / (2.0 * horizontal)
+    return np.where(horizontal > 0, ratio, np.nan)
+
+
+def eye_aspect_ratio(landmarks) -> np.ndarray:
+    """Mean EAR of both eyes per frame, shape (N,). NaN where the eye width is zero."""
+    frames = as_frames(landmarks)
+    layout = _INDEX[frames.shape[1]]
+    left = _eye_ratio(frames[:, layout["left_eye"], :2])
+    right = _eye_ratio(frames[:, layout["right_eye"], :2])
+    return (left + right) / 2.0
+
+
+def mouth_aspect_ratio(landmarks) -> np.ndarray:
+    """Inner-lip MAR per frame, shape (N,). NaN where the mouth width is zero."""
+    frames = as_frames(landmarks)
+    m = frames[:, _INDEX[frames.shape[1]]["mouth"], :2]
+    vertical = _dist(m[:, 1], m[:, 7]) + _dist(m[:, 2], m[:, 6]) + _dist(m[:, 3], m[:, 5])
+    horizontal = _dist(m[:, 0], m[:, 4])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = vertical / (3.0 * horizontal)
+    return np.where(horizontal > 0, ratio, np.nan)
+
+
+def compute_ratios(landmarks) -> Tuple[np.ndarray, np.ndarray]:
+    """(ear, mar) arrays of shape (N,) for a batch of frames."""
+    frames = as_frames(landmarks)
+    return eye_aspect_ratio(frames), mouth_aspect_ratio(frames)
+
+
+def frame_timestamps(n: int, timestamps: Optional[Sequence] = None, start=None,
+                     fps: Optional[float] = None) -> List[datetime]:
+    """
+    Per-frame timestamps (naive UTC): explicit ISO timestamps, or start + i/fps,
+    or now for every frame.
+    """
+    if timestamps is not None:
+        if len(timestamps) != n:
+            raise ValueError(f"{len(timestamps)} timestamps for {n} frames")
+        return [_parse_utc(t) for t in timestamps]
+    base = _parse_utc(start) if start else datetime.utcnow()
+    if not fps:
+        return [base] * n
+    if fps <= 0:
+        raise ValueError("fps must be positive")
+    step = 1.0 / float(fps)
+    return [base + timedelta(seconds=i * step) for i in range(n)]
+
+
+def _parse_utc(value: str) -> datetime:
+    ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
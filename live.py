@@ -0,0 +1,138 @@
+# live.py
+import asyncio
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Iterable, List, Optional, Set
+
+import telemetry
+
+# Per-subscriber bound on queued log events; state updates are coalesced instead
+MAX_EVENTS_PER_CLIENT = int(os.environ.get("LIVE_MAX_EVENTS_PER_CLIENT", "256"))
+KEEPALIVE_SECONDS = float(os.environ.get("LIVE_KEEPALIVE_SECONDS", "15"))
+
+
+def _iso(value) -> Optional[str]:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+class Subscriber:
+    """
+    One connected client. Only touched from the event loop thread.
+    Driver and metrics updates keep just the latest value per driver;
+    log events sit in a bounded deque that drops the oldest when full.
+    """
+
+    def __init__(self, driver_ids: Optional[Set[int]], max_events: int = MAX_EVENTS_PER_CLIENT):
+        self.driver_ids = driver_ids
+        self.states: dict = {}
+        self.events: deque = deque(maxlen=max_events)
+        self.dropped = 0
+        self.ready = asyncio.Event()
+
+    def wants(self, driver_id) -> bool:
+        return self.driver_ids is None or driver_id in self.driver_ids
+
+    def push(self, message: dict):
+        if not self.wants(message.get("driver_id")):
+            return
+        if message["type"] == "log":
+            if len(self.events) == self.events.maxlen:
+                self.dropped += 1
+            self.events.append(message)
+        else:
+            self.states[(message["type"], message.get("driver_id"))] = message
+        self.ready.set()
+
+    async def get(self, timeout: Optional[float] = None) -> List[dict]:
+        """Wait for pending messages and return them all; [] on timeout."""
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self.ready.clear()
+        messages = list(self.states.values())
+        messages.extend(self.events)
+        if self.dropped:
+            messages.append({"type": "dropped", "count": self.dropped})
+            self.dropped = 0
+        self.states.clear()
+        self.events.clear()
+        return messages
+
+
+class Broker:
+    """
+    Fans out driver and log updates to subscribers. publish_* may be called
+    from any thread; delivery is handed to the event loop in one callback.
+    """
+
+    def __init__(self):
+        self.subscribers: Set[Subscriber] = set()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, driver_ids: Optional[Iterable[int]] = None) -> Subscriber:
+        self.loop = asyncio.get_running_loop()
+        sub = Subscriber(set(driver_ids) if driver_ids else None)
+        with self._lock:
+            self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        with self._lock:
+            self.subscribers.discard(sub)
+
+    def publish(self, messages: List[dict]):
+        if not messages or not self.subscribers or self.loop is None or self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self._dispatch, messages)
+
+    def _dispatch(self, messages: List[dict]):
+        with self._lock:
+            subscribers = list(self.subscribers)
+        for sub in subscribers:
+            for message in messages:
+                sub.push(message)
+
+    def publish_driver(self, driver_id: int, driver: Optional[dict]):
+        if driver is None:
+            self.publish([{"type": "driver", "driver_id": driver_id, "deleted": True}])
+        else:
+            self.publish([{"type": "driver", "driver_id": driver_id, "driver": driver}])
+
+    def publish_logs(self, rows: List[dict], ids: List[int]):
+        if not self.subscribers:
+            return
+        messages = []
+        for row, log_id in zip(rows, ids):
+            data = telemetry.decode_data(row.get("data"))
+            ts = _iso(row.get("timestamp"))
+            messages.append({
+                "type": "log",
+                "log_id": log_id,
+                "driver_id": row.get("driver_id"),
+                "event_type": row.get("event_type"),
+                "data": data,
+                "timestamp": ts,
+            })
+            if "ear" in data or "mar" in data:
+                messages.append({
+                    "type": "metrics",
+                    "driver_id": row.get("driver_id"),
+                    "ear": data.get("ear"),
+                    "mar": data.get("mar"),
+                    "timestamp": ts,
+                })
+        self.publish(messages)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "queued_events": sum(len(s.events) for s in list(self.subscribers)),
+        }
+
+
+broker = Broker()
+telemetry.add_listener(broker.publish_logs)
@@ -0,0 +1,128 @@
+# log_query.py
+import base64
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+
+import retention
+import telemetry
+from models import LogEntry, LogRollup
+from rollups import bucket_start
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(ts: datetime, log_id: int) -> str:
+    raw = json.dumps([ts.isoformat(), log_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, log_id = json.loads(raw)
+        return datetime.fromisoformat(ts), int(log_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {e}")
+
+
+# field -> (min, max), either bound optional; min inclusive, max exclusive
+MetricRanges = Dict[str, Tuple[Optional[float], Optional[float]]]
+
+
+def filtered(stmt, driver_id: Optional[int] = None, event_type: Optional[str] = None,
+             start: Optional[datetime] = None, end: Optional[datetime] = None,
+             metric_ranges: Optional[MetricRanges] = None):
+    for name, (low, high) in (metric_ranges or {}).items():
+        column = getattr(LogEntry, name)
+        if low is not None:
+            stmt = stmt.where(column >= low)
+        if high is not None:
+            stmt = stmt.where(column < high)
+    if driver_id is not None:
+        stmt = stmt.where(LogEntry.driver_id == driver_id)
+    if event_type:
+        stmt = stmt.where(LogEntry.event_type == event_type)
+    if start is not None:
+        stmt = stmt.where(LogEntry.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(LogEntry.timestamp < end)
+    return stmt
+
+
+def after_cursor(stmt, cursor: Optional[str], descending: bool = True):
+    # Keyset condition on (timestamp, id), written so the leading timestamp term
+    # is a plain index range
+    if not cursor:
+        return stmt
+    ts, log_id = decode_cursor(cursor)
+    if descending:
+        return stmt.where(LogEntry.timestamp <= ts, or_(LogEntry.timestamp < ts, LogEntry.id < log_id))
+    return stmt.where(LogEntry.timestamp >= ts, or_(LogEntry.timestamp > ts, LogEntry.id > log_id))
+
+
+def serialize(log: LogEntry) -> dict:
+    return {
+        "id": log.id,
+        "driver_id": log.driver_id,
+        "event_type": log.event_type,
+        "data": telemetry.decode_data(log.data),
+        "timestamp": log.timestamp.isoformat() if log.timestamp else None,
+    }
+
+
+def fetch_page(db: Session, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+               **filters) -> Tuple[List[LogEntry], Optional[str]]:
+    """Newest-first page of logs plus the cursor for the next page (None at the end)."""
+    stmt = filtered(select(LogEntry), **filters)
+    stmt = after_cursor(stmt, cursor)
+    stmt = stmt.order_by(LogEntry.timestamp.desc(), LogEntry.id.desc()).limit(limit + 1)
+    rows = list(db.scalars(stmt))
+    # Archived months are merged in newest first, stopping once a partition
+    # ends before the oldest row the page would keep
+    newest = decode_cursor(cursor)[0] if cursor else None
+    for part in retention.partitions_for(db, filters.get("start"), filters.get("end"), newest_first=True):
+        if newest is not None and part.min_ts > newest:
+            continue
+        if len(rows) > limit and part.max_ts < rows[limit].timestamp:
+            break
+        with retention.partition_session(part) as pdb:
+            rows.extend(pdb.scalars(stmt))
+        rows.sort(key=lambda r: (r.timestamp, r.id), reverse=True)
+        del rows[limit + 1:]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.timestamp, last.id)
+    return rows, next_cursor
+
+
+def approximate_count(db: Session, driver_id: Optional[int] = None, event_type: Optional[str] = None,
+                      start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      metric_ranges: Optional[MetricRanges] = None) -> Optional[int]:
+    """
+    Row count from the daily rollups instead of COUNT(*) on logs. Exact for
+    whole days; partial days at the range edges are counted in full. None
+    when filtering on metric ranges, which the rollups can't answer.
+    """
+    if any(low is not None or high is not None for low, high in (metric_ranges or {}).values()):
+        return None
+    stmt = select(func.coalesce(func.sum(LogRollup.count), 0)).where(LogRollup.resolution == "day")
+    if driver_id is not None:
+        stmt = stmt.where(LogRollup.driver_id == driver_id)
+    if event_type:
+        stmt = stmt.where(LogRollup.event_type == event_type)
+    if start is not None:
+        stmt = stmt.where(LogRollup.bucket >= bucket_start(start, "day"))
+    if end is not None:
+        stmt = stmt.where(LogRollup.bucket < end)
+    return db.scalar(stmt)
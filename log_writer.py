@@ -0,0 +1,161 @@
+# log_writer.py
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Optional
+
+from database import SessionLocal
+from telemetry import insert_log_batch
+
+MAX_QUEUE = int(os.environ.get("LOG_WRITER_MAX_QUEUE", "10000"))
+BATCH_SIZE = int(os.environ.get("LOG_WRITER_BATCH_SIZE", "500"))
+FLUSH_INTERVAL = float(os.environ.get("LOG_WRITER_FLUSH_MS", "200")) / 1000.0
+# How long submit() may block waiting for room before rejecting (backpressure)
+ENQUEUE_TIMEOUT = float(os.environ.get("LOG_WRITER_ENQUEUE_TIMEOUT_MS", "50")) / 1000.0
+DURABLE_TIMEOUT = float(os.environ.get("LOG_WRITER_DURABLE_TIMEOUT_S", "10"))
+
+_STOP = object()
+
+
+class WriterFull(Exception):
+    pass
+
+
+class LogWriter:
+    """
+    Write-behind buffer for LogEntry rows. A background thread drains the
+    queue and group-commits up to batch_size rows per transaction, at least
+    every flush_interval seconds. A batch holding a durable row (one whose
+    caller waits on the commit) is flushed as soon as the queue is empty
+    instead of lingering for more rows.
+    """
+
+    def __init__(self, session_factory=SessionLocal, max_queue: int = MAX_QUEUE,
+                 batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "failed": 0,
+            "rejected": 0,
+            "flushes": 0,
+            "last_batch_size": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 30.0):
+        # Drain everything already queued, then stop the thread
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if not thread or not thread.is_alive():
+            return
+        self.queue.put(_STOP)
+        thread.join(timeout)
+
+    def submit(self, row: dict, durable: bool = False) -> Future:
+        """
+        Queue a row for writing. The returned Future resolves to the new log id
+        once the batch holding it is committed. Pass durable=True when the
+        caller will wait on it, so the batch is not held back for more rows.
+        Raises WriterFull when the queue stays full for longer than ENQUEUE_TIMEOUT.
+        """
+        if not self._thread:
+            self.start()
+        future: Future = Future()
+        try:
+            self.queue.put((row, future, durable), timeout=ENQUEUE_TIMEOUT)
+        except queue.Full:
+            self._stats["rejected"] += 1
+            raise WriterFull("Log writer queue is full")
+        self._stats["enqueued"] += 1
+        return future
+
+    def _run(self):
+        stopping = False
+        while True:
+            # Once stopping, only drain what is already queued
+            try:
+                item = self.queue.get_nowait() if stopping else self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if stopping:
+                    return
+                continue
+            if item is _STOP:
+                stopping = True
+                continue
+            batch = [item]
+            # Someone is waiting on this batch: take what is already queued, don't linger
+            urgent = item[2]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if stopping or urgent or remaining <= 0:
+                        item = self.queue.get_nowait()
+                    else:
+                        item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    continue
+                batch.append(item)
+                urgent = urgent or item[2]
+            self._flush(batch)
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        started = time.perf_counter()
+        db = self.session_factory()
+        try:
+            ids = insert_log_batch(db, [row for row, _, _ in batch])
+        except Exception as e:
+            print(f"Log Writer Flush Error: {e}")
+            self._stats["failed"] += len(batch)
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        finally:
+            db.close()
+        for (_, future, _), log_id in zip(batch, ids):
+            future.set_result(log_id)
+        elapsed = (time.perf_counter() - started) * 1000.0
+        s = self._stats
+        s["written"] += len(batch)
+        s["flushes"] += 1
+        s["last_batch_size"] = len(batch)
+        s["last_flush_ms"] = round(elapsed, 3)
+        s["max_flush_ms"] = round(max(s["max_flush_ms"], elapsed), 3)
+        s["total_flush_ms"] += elapsed
+
+    def stats(self) -> dict:
+        s = dict(self._stats)
+        total = s.pop("total_flush_ms")
+        s["avg_flush_ms"] = round(total / s["flushes"], 3) if s["flushes"] else 0.0
+        s["queue_depth"] = self.queue.qsize()
+        s["max_queue"] = self.queue.maxsize
+        s["batch_size"] = self.batch_size
+        s["flush_interval_ms"] = self.flush_interval * 1000.0
+        s["running"] = bool(self._thread and self._thread.is_alive())
+        return s
+
+
+writer = LogWriter()
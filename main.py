@@ -1,33 +1,114 @@
 # main.py
-from fastapi import FastAPI, Request, Form, Depends, HTTPException, Header
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import APIRouter, FastAPI, Request, Form, Depends, HTTPException, Header, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional
+import asyncio
+import json
 from pydantic import BaseModel
 
 # Import your existing DB/session/models/auth helpers
 # Ensure these modules exist and export the names used below
-from database import SessionLocal, engine
+from database import SessionLocal, engine, describe_engine
 import models
-from models import User, OTP, DriverProfile, LogEntry
+import migrations
+from models import User, OTP, DriverProfile, LogEntry, UserOut
 
 # auth helpers you already used earlier
 from auth import (
-    get_password_hash, verify_password, create_access_token,
-    decode_access_token, generate_otp_code, send_otp
+    get_password_hash, verify_password, verify_and_update_password, create_access_token,
+    decode_access_token, generate_otp_code, send_otp, hasher, HasherBusy
 )
+import mailer
+import otps
+import principals
+import telemetry
+import log_writer
+import live
+import drivers
+import rollups
+import drowsiness
+import scoring
+import fleet
+import log_query
+import export
+import retention
+import metrics
+import assets
+import pages
+
+# Routes are registered on this router and attached to the app by create_app()
+router = APIRouter()
+
+# Component stats exported as gauges on /metrics
+metrics.registry.add_collector("hasher", hasher.stats)
+metrics.registry.add_collector("mailer", lambda: mailer.get_mailer().stats() if mailer.get_mailer() else {})
+metrics.registry.add_collector("log_writer", log_writer.writer.stats)
+metrics.registry.add_collector("live", live.broker.stats)
+metrics.registry.add_collector("detector", drowsiness.detector.stats)
+metrics.registry.add_collector("principal_cache", principals.principal_cache.stats)
+metrics.registry.add_collector("scores", scoring.score_engine.stats)
+
+# Serve ./static; fingerprinted copies under static/dist are cached as immutable
+static_files = assets.AssetFiles(directory="static")
+metrics.registry.add_collector("assets", static_files.stats)
+templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset"] = assets.asset_url
+page_cache = pages.PageCache(templates)
+metrics.registry.add_collector("page_cache", page_cache.stats)
 
-# Create DB tables (safe to call on every start)
-models.Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Vehicle Safety - Web Frontend")
+def start_background_writers():
+    # Report the active database profile once so misconfiguration shows up in the logs
+    try:
+        print(f"[DB] {describe_engine(engine)}")
+    except Exception as e:
+        print(f"[DB] Self-check failed: {e}")
+        raise
+    # Full schema upgrade only when this code's schema isn't recorded yet; once per deploy, not per worker
+    if migrations.ensure_schema(engine):
+        print(f"[Migrations] Schema upgraded to version {migrations.schema_version()}")
+    # Legacy log rows get their typed fields in the background; nothing waits for it
+    migrations.backfiller.start(engine)
+    assets.load()
+    # Compiled templates persist across restarts; the cache directory is created here, not at import
+    if templates.env.bytecode_cache is None:
+        templates.env.bytecode_cache = pages.bytecode_cache()
+    pages.warm(templates)
+    drivers.registry.seed(SEED_DRIVERS)
+    fleet.fleet.start()
+    log_writer.writer.start()
+    otps.purger.start()
+    retention.worker.start()
+
+
+def stop_background_writers():
+    # Flush any buffered log rows before the process exits
+    log_writer.writer.stop()
+    migrations.backfiller.stop()
+    fleet.fleet.stop()
+    otps.purger.stop()
+    retention.worker.stop()
+    mailer.shutdown()
+    hasher.shutdown()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_background_writers()
+    try:
+        yield
+    finally:
+        stop_background_writers()
 
-# Serve static files from ./static
-app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
+
+async def hasher_busy_handler(request: Request, exc: HasherBusy):
+    # bcrypt pool saturated: fail fast instead of queueing behind the login burst
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
 
 
 # Dependency: DB session
@@ -40,30 +121,32 @@ def get_db():
 
 
 # --- Pages ---
-@app.get("/", response_class=HTMLResponse)
+@router.get("/", response_class=HTMLResponse)
 async def landing_page(request: Request):
-    return templates.TemplateResponse("landing.html", {"request": request})
+    return page_cache.render(request, "landing.html")
 
 
-@app.get("/login", response_class=HTMLResponse)
+@router.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request):
-    return templates.TemplateResponse("login.html", {"request": request})
+    return page_cache.render(request, "login.html")
 
 
-@app.get("/register", response_class=HTMLResponse)
+@router.get("/register", response_class=HTMLResponse)
 async def register_page(request: Request):
-    return templates.TemplateResponse("register.html", {"request": request})
+    return page_cache.render(request, "register.html")
 
 
-@app.get("/dashboard", response_class=HTMLResponse)
+@router.get("/dashboard", response_class=HTMLResponse)
 async def dashboard_page(request: Request):
     # you can check token here in prod; for demo we just render template
-    return templates.TemplateResponse("dashboard.html", {"request": request})
+    return page_cache.render(request, "dashboard.html")
 
 
-@app.get("/drivers", response_class=HTMLResponse)
-async def drivers_page(request: Request):
-    return templates.TemplateResponse("drivers.html", {"request": request, "drivers": list(MOCK_DRIVERS.values())})
+@router.get("/drivers", response_class=HTMLResponse)
+def drivers_page(request: Request):
+    # Keyed on the shared drivers version; live fields (scores, auth status) refresh within PAGE_LIVE_TTL_S
+    return page_cache.render(request, "drivers.html", context_fn=lambda: {"drivers": drivers.registry.all()},
+                             version=drivers.registry.version(), ttl=pages.PAGE_LIVE_TTL_S)
 
 
 # API Models
@@ -75,44 +158,40 @@ class DriverModel(BaseModel):
     status: Optional[str] = "Active Now"
     bg_color: Optional[str] = "#10b981" # Green default
 
-@app.post("/api/drivers")
+@router.post("/api/drivers")
 async def add_driver(driver: DriverModel):
-    new_id = max(MOCK_DRIVERS.keys()) + 1 if MOCK_DRIVERS else 1
-    new_driver = driver.dict()
-    new_driver['id'] = new_id
-    new_driver['score'] = 100 # Default score
-    new_driver['status_color'] = "#34d399"
-    new_driver['drive_time'] = "0h 0m"
-    new_driver['distance'] = "0 km"
-    new_driver['photo'] = "/static/img/driver_1.png" # Placeholder
-    new_driver['ear'] = 0.30
-    new_driver['mar'] = 0.02
-    new_driver['auth_status'] = "Verified"
-    new_driver['face_confidence'] = 99.0
-    new_driver['last_verified'] = "Just now"
-
-    MOCK_DRIVERS[new_id] = new_driver
+    new_driver = await run_in_threadpool(drivers.registry.create, driver.dict())
+    live.broker.publish_driver(new_driver["id"], new_driver)
     return {"success": True, "driver": new_driver}
 
-@app.put("/api/drivers/{driver_id}")
+@router.put("/api/drivers/{driver_id}")
 async def update_driver(driver_id: int, driver: DriverModel):
-    if driver_id not in MOCK_DRIVERS:
-        return {"success": False, "error": "Driver not found"}
-    
     # Update existing fields
-    MOCK_DRIVERS[driver_id].update(driver.dict(exclude_unset=True))
-    return {"success": True, "driver": MOCK_DRIVERS[driver_id]}
+    updated = await run_in_threadpool(drivers.registry.update, driver_id, driver.dict(exclude_unset=True))
+    if not updated:
+        return {"success": False, "error": "Driver not found"}
+    live.broker.publish_driver(driver_id, updated)
+    return {"success": True, "driver": updated}
+
+def _forget_face(driver_id: int):
+    # A deleted driver's embedding must not keep matching in search or verify
+    import faces
+    try:
+        faces.get_index().remove(driver_id)
+    except Exception as e:
+        print(f"Face Remove Error: {e}")
 
-@app.delete("/api/drivers/{driver_id}")
+@router.delete("/api/drivers/{driver_id}")
 async def delete_driver(driver_id: int):
-    if driver_id in MOCK_DRIVERS:
-        del MOCK_DRIVERS[driver_id]
+    if await run_in_threadpool(drivers.registry.delete, driver_id):
+        await run_in_threadpool(_forget_face, driver_id)
+        live.broker.publish_driver(driver_id, None)
         return {"success": True}
     return {"success": False, "error": "Driver not found"}
 
 
-# Mock Drivers Database (unchanged)
-MOCK_DRIVERS = {
+# Demo drivers, seeded into an empty drivers table on startup
+SEED_DRIVERS = {
     1: {
         "id": 1, 
         "name": "Akash", 
@@ -175,31 +254,37 @@ MOCK_DRIVERS = {
     }
 }
 
-@app.get("/driver/{driver_id}", response_class=HTMLResponse)
-async def driver_details_page(request: Request, driver_id: int):
-    driver = MOCK_DRIVERS.get(driver_id, MOCK_DRIVERS[1]) 
-    return templates.TemplateResponse("driver_details.html", {"request": request, "driver": driver})
+@router.get("/driver/{driver_id}", response_class=HTMLResponse)
+def driver_details_page(request: Request, driver_id: int):
+    driver = drivers.registry.get(driver_id)
+    if driver is None:
+        fleet = drivers.registry.all()
+        if not fleet:
+            raise HTTPException(status_code=404, detail="Driver not found")
+        driver = fleet[0]
+    return page_cache.render(request, "driver_details.html", {"driver": driver}, version=drivers.registry.version(),
+                             key=driver["id"], ttl=pages.PAGE_LIVE_TTL_S)
 
 
-@app.get("/logs", response_class=HTMLResponse)
+@router.get("/logs", response_class=HTMLResponse)
 async def logs_page(request: Request):
-    return templates.TemplateResponse("logs.html", {"request": request})
+    return page_cache.render(request, "logs.html")
 
 
-@app.get("/settings", response_class=HTMLResponse)
+@router.get("/settings", response_class=HTMLResponse)
 async def settings_page(request: Request):
-    return templates.TemplateResponse("settings.html", {"request": request})
+    return page_cache.render(request, "settings.html")
 
 
 # New: verify page that shows OTP input and pre-fills email if provided
-@app.get("/verify", response_class=HTMLResponse)
+@router.get("/verify", response_class=HTMLResponse)
 async def verify_page(request: Request, email: Optional[str] = None):
     return templates.TemplateResponse("verify.html", {"request": request, "email": email or ""})
 
 
 # --- API endpoints ---
 
-@app.post("/api/register")
+@router.post("/api/register")
 def api_register(
     username: str = Form(...),
     email: str = Form(...),
@@ -242,41 +327,48 @@ def api_register(
         return JSONResponse(status_code=500, content={"detail": f"Registration failed: {str(e)}"})
 
 
-@app.post("/api/verify-otp")
+@router.post("/api/verify-otp")
 def api_verify_otp(email: str = Form(...), code: str = Form(...), purpose: str = Form("register"), db: Session = Depends(get_db)):
-    rec = (
-        db.query(OTP)
-        .filter(OTP.email == email, OTP.code == code, OTP.purpose == purpose)
-        .order_by(OTP.id.desc())
-        .first()
-    )
+    rec = otps.find_active(db, email, code, purpose)
     if not rec:
         raise HTTPException(status_code=400, detail="Invalid OTP")
     if rec.expiry < datetime.utcnow():
         raise HTTPException(status_code=400, detail="OTP expired")
 
-    # Only mark user as verified if this was a registration OTP
+    # Only mark user as verified if this was a registration OTP.
+    # Reset OTPs are consumed later by /api/reset-password.
     if purpose == "register":
+        if not otps.consume(db, rec):
+            raise HTTPException(status_code=400, detail="Invalid OTP")
+        db.commit()
         user = db.query(User).filter(User.email == email).first()
         if user:
             user.is_verified = True
             db.commit()
+            principals.invalidate_user(user.id)
 
     return {"ok": True, "message": "Verified"}
 
 
-@app.post("/api/login")
+@router.post("/api/login")
 def api_login(email: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
     user = db.query(User).filter(User.email == email).first()
-    if not user or not verify_password(password, user.password_hash):
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    ok, new_hash = verify_and_update_password(password, user.password_hash)
+    if not ok:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # bcrypt cost changed since this hash was made; upgrade it transparently
+        user.password_hash = new_hash
+        db.commit()
     if not user.is_verified:
         raise HTTPException(status_code=403, detail="Account not verified")
     token = create_access_token({"sub": user.email, "user_id": user.id})
     return {"access_token": token, "token_type": "bearer"}
 
 
-@app.post("/api/request-reset")
+@router.post("/api/request-reset")
 def api_request_reset(email: str = Form(...), db: Session = Depends(get_db)):
     user = db.query(User).filter(User.email == email).first()
     if not user:
@@ -286,76 +378,185 @@ def api_request_reset(email: str = Form(...), db: Session = Depends(get_db)):
     o = OTP(user_id=user.id, email=email, code=code, expiry=expiry, purpose="reset")
     db.add(o)
     db.commit()
-    send_otp(email, code, purpose="reset")
+    try:
+        send_otp(email, code, purpose="reset")
+    except mailer.MailQueueFull:
+        raise HTTPException(status_code=503, detail="Mail queue is full, retry shortly")
     return {"ok": True, "message": "OTP sent"}
 
 
-@app.post("/api/reset-password")
+@router.post("/api/reset-password")
 def api_reset_password(email: str = Form(...), code: str = Form(...), new_password: str = Form(...), db: Session = Depends(get_db)):
-    rec = (
-        db.query(OTP)
-        .filter(OTP.email == email, OTP.code == code, OTP.purpose == "reset")
-        .order_by(OTP.id.desc())
-        .first()
-    )
+    rec = otps.find_active(db, email, code, "reset")
     if not rec or rec.expiry < datetime.utcnow():
         raise HTTPException(status_code=400, detail="Invalid or expired OTP")
     user = db.query(User).filter(User.email == email).first()
+    if not user or not otps.consume(db, rec):
+        raise HTTPException(status_code=400, detail="Invalid or expired OTP")
     user.password_hash = get_password_hash(new_password)
     user.is_verified = True  # Mark verified since they proved email ownership
     db.commit()
+    principals.invalidate_user(user.id)
     return {"ok": True, "message": "Password reset successful"}
 
 
-@app.get("/api/profile")
-def api_get_profile(authorization: Optional[str] = Header(None), db: Session = Depends(get_db)):
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    # Async so the threadpool gauges are sampled on the event loop, not from inside the pool
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/api/metrics/slow-queries")
+def slow_queries():
+    return {"ok": True, "threshold_ms": metrics.SLOW_QUERY_MS, "samples": metrics.slow_queries()}
+
+
+@router.get("/api/mail/stats")
+def mail_stats():
+    m = mailer.get_mailer()
+    return {"ok": True, "configured": m is not None, "mailer": m.stats() if m else None}
+
+
+@router.get("/api/fleet/summary")
+def fleet_summary(top: int = fleet.FLEET_TOP_N):
+    return {"ok": True, **fleet.fleet.summary(top)}
+
+
+@router.get("/api/drivers/{driver_id}/score")
+def driver_score(driver_id: int):
+    return {"ok": True, **scoring.score_engine.breakdown(driver_id)}
+
+
+class FaceEmbeddingIn(BaseModel):
+    embedding: List[float]
+
+
+class FaceSearchIn(BaseModel):
+    embeddings: List[List[float]]
+    k: int = 5
+
+
+@router.post("/api/drivers/{driver_id}/face")
+def enroll_face(driver_id: int, body: FaceEmbeddingIn):
+    import faces  # numpy; imported on first use to keep worker start fast
+    if drivers.registry.get(driver_id) is None:
+        raise HTTPException(status_code=404, detail="Driver not found")
+    try:
+        enrolled = faces.get_index().enroll(driver_id, body.embedding)
+    except faces.FaceError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"ok": True, "driver_id": driver_id, "enrolled": enrolled}
+
+
+@router.delete("/api/drivers/{driver_id}/face")
+def remove_face(driver_id: int):
+    import faces
+    if not faces.get_index().remove(driver_id):
+        raise HTTPException(status_code=404, detail="No face enrolled for this driver")
+    return {"ok": True}
+
+
+@router.post("/api/drivers/{driver_id}/face/verify")
+def verify_face(driver_id: int, body: FaceEmbeddingIn):
+    """
+    Match a cab-side face embedding against the claimed driver and every
+    enrolled driver; records auth_status / face_confidence / last_verified
+    on the driver and logs face_verification_failed on a mismatch.
+    """
+    import faces
+    try:
+        result = faces.get_index().verify(driver_id, body.embedding)
+    except faces.FaceError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="No face enrolled for this driver")
+    now = datetime.utcnow()
+    drivers.registry.update_live({driver_id: {
+        "auth_status": "Verified" if result["verified"] else "Mismatch",
+        "face_confidence": round(max(result["score"], 0.0) * 100.0, 1),
+        "last_verified": now.isoformat(timespec="seconds"),
+    }})
+    if not result["verified"]:
+        row = {"driver_id": driver_id, "event_type": "face_verification_failed", "timestamp": now,
+               "data": telemetry.encode_data({"score": result["score"], "threshold": result["threshold"],
+                                              "best_match": result["best_match"]})}
+        try:
+            log_writer.writer.submit(row)
+        except log_writer.WriterFull:
+            print(f"Face Verification Log Error: queue full, driver {driver_id}")
+    return {"ok": True, **result}
+
+
+@router.post("/api/faces/search")
+def search_faces(body: FaceSearchIn):
+    import faces
+    if not body.embeddings:
+        return {"ok": True, "results": []}
+    try:
+        ids, scores = faces.get_index().search(body.embeddings, max(1, min(body.k, 100)))
+    except faces.FaceError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"ok": True, "results": [
+        [{"driver_id": int(i), "score": round(float(sc), 4)} for i, sc in zip(row_ids, row_scores)]
+        for row_ids, row_scores in zip(ids, scores)
+    ]}
+
+
+@router.get("/api/faces/stats")
+def face_index_stats():
+    import faces
+    return {"ok": True, **faces.get_index().stats()}
+
+
+@router.get("/api/detector/stats")
+def detector_stats():
+    return {"ok": True, "detector": drowsiness.detector.stats()}
+
+
+@router.get("/api/auth/hash-stats")
+def auth_hash_stats():
+    return {"ok": True, "hasher": hasher.stats()}
+
+
+# Dependencies: authenticated user, resolved through the principal cache
+def current_user(authorization: Optional[str] = Header(None), db: Session = Depends(get_db)) -> UserOut:
     if not authorization:
-        # Fallback: check validation of standard Bearer flow
         raise HTTPException(status_code=401, detail="Missing Authorization header")
-    
-    try:
-        scheme, token = authorization.split()
-        if scheme.lower() != 'bearer':
-            raise HTTPException(status_code=401, detail="Invalid authentication scheme")
-        
-        payload = decode_access_token(token)
-        if not payload:
-             raise HTTPException(status_code=401, detail="Invalid token")
-             
-        user_email = payload.get("sub")
-        user = db.query(User).filter(User.email == user_email).first()
-        
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-            
-        return {
-            "ok": True,
-            "username": user.username,
-            "email": user.email,
-            "role": "System Administrator" if user.is_admin else "Standard User",
-            "is_verified": user.is_verified
-        }
-    except Exception as e:
-        print(f"Profile Fetch Error: {e}")
+    parts = authorization.split()
+    if len(parts) != 2 or parts[0].lower() != "bearer":
+        raise HTTPException(status_code=401, detail="Invalid authentication scheme")
+    principal = principals.resolve(parts[1], db)
+    if not principal:
         raise HTTPException(status_code=401, detail="Invalid token or expired session")
+    return principal
 
-@app.post("/api/update-profile")
+
+def current_user_form(token: str = Form(...), db: Session = Depends(get_db)) -> UserOut:
+    # Same as current_user, for the settings forms that post the token as a field
+    principal = principals.resolve(token, db)
+    if not principal:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return principal
+
+
+@router.get("/api/profile")
+def api_get_profile(user: UserOut = Depends(current_user)):
+    return {
+        "ok": True,
+        "username": user.username,
+        "email": user.email,
+        "role": "System Administrator" if user.is_admin else "Standard User",
+        "is_verified": user.is_verified
+    }
+
+@router.post("/api/update-profile")
 def api_update_profile(
     username: str = Form(...),
     email: str = Form(...),
-    token: str = Form(...),
+    principal: UserOut = Depends(current_user_form),
     db: Session = Depends(get_db)
 ):
-    # secure token check
-    try:
-        payload = decode_access_token(token)
-        user_email = payload.get("sub")
-        if not user_email:
-             raise HTTPException(status_code=401, detail="Invalid token")
-    except:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    user = db.query(User).filter(User.email == user_email).first()
+    user = db.get(User, principal.id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -370,77 +571,397 @@ def api_update_profile(
     user.username = username
     user.email = email
     db.commit()
+    principals.invalidate_user(user.id)
     
     return {"ok": True, "message": "Profile updated"}
 
 
-@app.post("/api/change-password")
+@router.post("/api/change-password")
 def api_change_password(
     current_password: str = Form(...),
     new_password: str = Form(...),
-    token: str = Form(...),
+    principal: UserOut = Depends(current_user_form),
     db: Session = Depends(get_db)
 ):
-    # 1. Verify Token
-    try:
-        payload = decode_access_token(token)
-        user_email = payload.get("sub")
-        if not user_email:
-             raise HTTPException(status_code=401, detail="Invalid token")
-    except:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    user = db.query(User).filter(User.email == user_email).first()
+    user = db.get(User, principal.id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # 2. Verify Current Password
+    # 1. Verify Current Password
     if not verify_password(current_password, user.password_hash):
         raise HTTPException(status_code=400, detail="Incorrect current password")
 
-    # 3. Update Password
+    # 2. Update Password
     user.password_hash = get_password_hash(new_password)
     db.commit()
+    principals.invalidate_user(user.id)
 
     return {"ok": True, "message": "Password updated successfully"}
 
 
 # Driver profile endpoints (examples)
-@app.post("/api/driver/profile")
+@router.post("/api/driver/profile")
 def create_driver_profile(token: str = Form(...), name: str = Form(...), phone: str = Form(None), vehicle_no: str = Form(None), db: Session = Depends(get_db)):
     # token validation omitted for brevity
     user = db.query(User).filter(User.email == token).first()
     if not user:
         raise HTTPException(status_code=401, detail="Invalid token")
-    dp = DriverProfile(user_id=user.id, name=name, phone=phone, vehicle_no=vehicle_no)
-    db.add(dp)
-    db.commit()
-    db.refresh(dp)
-    return {"ok": True, "driver_id": dp.id}
+    # Through the registry so the cache version is bumped and other workers see the new driver
+    driver = drivers.registry.create({"user_id": user.id, "name": name, "phone": phone, "vehicle": vehicle_no})
+    live.broker.publish_driver(driver["id"], driver)
+    return {"ok": True, "driver_id": driver["id"]}
+
+
+@router.post("/api/driver/log")
+def driver_log(token: str = Form(...), driver_id: int = Form(...), event_type: str = Form(...), data: str = Form(None), durable: bool = Form(True)):
+    # Rows go through the write-behind queue and are group-committed with concurrent writes.
+    # By default this waits for the commit and returns the new log id; durable=false
+    # returns as soon as the row is queued, without a log id.
+    row = {"driver_id": driver_id, "event_type": event_type, "data": data or "{}", "timestamp": datetime.utcnow()}
+    try:
+        future = log_writer.writer.submit(row, durable=durable)
+    except log_writer.WriterFull:
+        raise HTTPException(status_code=503, detail="Log queue is full, retry later")
+    if not durable:
+        return {"ok": True, "queued": True}
+    try:
+        log_id = future.result(timeout=log_writer.DURABLE_TIMEOUT)
+    except Exception as e:
+        print(f"Driver Log Error: {e}")
+        raise HTTPException(status_code=500, detail="Failed to write log")
+    return {"ok": True, "log_id": log_id}
+
+
+@router.get("/api/driver/log/stats")
+def driver_log_stats():
+    return {"ok": True, "writer": log_writer.writer.stats()}
+
+
+@router.post("/api/driver/logs/batch")
+async def driver_log_batch(request: Request, token: Optional[str] = None, db: Session = Depends(get_db)):
+    # Accepts a JSON array (or {"events": [...]}), an NDJSON stream of events,
+    # or a binary batch (Content-Type: application/x-telemetry-batch, see wire.py)
+    # token validation omitted for brevity, same as /api/driver/log
+    batch = telemetry.BatchIngest(db)
+    content_type = request.headers.get("content-type")
+    if telemetry.is_wire(content_type):
+        import wire  # numpy; imported on the first binary batch
+        body = await request.body()
+        try:
+            rows = wire.decode(body).rows()
+        except wire.WireError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid binary batch: {e}")
+        for row, error in rows:
+            if batch.add_row(row, error):
+                await run_in_threadpool(batch.flush)
+            if batch.truncated:
+                break
+    elif telemetry.is_ndjson(content_type):
+        async for item, error in telemetry.iter_ndjson(request.stream()):
+            if batch.add(item, error):
+                await run_in_threadpool(batch.flush)
+            if batch.truncated:
+                break  # stop reading the stream past the batch limit
+    else:
+        body = await request.body()
+        try:
+            items = list(telemetry.iter_json_array(body))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid batch payload: {e}")
+        for item, error in items:
+            if batch.add(item, error):
+                await run_in_threadpool(batch.flush)
+            if batch.truncated:
+                break
+    await run_in_threadpool(batch.flush)
+    return batch.summary()
+
+
+@router.post("/api/driver/landmarks")
+async def driver_landmarks(request: Request, token: Optional[str] = None, db: Session = Depends(get_db)):
+    """
+    Ingest a batch of facial landmark frames for one driver:
+    {"driver_id": 1, "frames": [[[x, y], ...], ...], "timestamps": [...]?, "start": iso?, "fps": 15?}
+    EAR/MAR are computed server-side and stored as face_metrics log events.
+    """
+    # token validation omitted for brevity, same as /api/driver/log
+    import landmarks  # numpy; imported on first use to keep worker start fast
+    try:
+        body = await request.json()
+        driver_id = int(body["driver_id"])
+        frames = landmarks.as_frames(body["frames"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid landmark batch: {e}")
+    n = frames.shape[0]
+    if n > telemetry.MAX_BATCH_EVENTS:
+        raise HTTPException(status_code=413, detail=f"At most {telemetry.MAX_BATCH_EVENTS} frames per batch")
+    try:
+        timestamps = landmarks.frame_timestamps(n, body.get("timestamps"), body.get("start"), body.get("fps"))
+    except (AttributeError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid landmark batch: {e}")
+
+    ear, mar = landmarks.compute_ratios(frames)
+    ear_values = [None if v != v else round(float(v), 4) for v in ear]
+    mar_values = [None if v != v else round(float(v), 4) for v in mar]
+    rows = [
+        {
+            "driver_id": driver_id,
+            "event_type": "face_metrics",
+            "data": telemetry.encode_data({"ear": e, "mar": m, "source": "landmarks"}),
+            "timestamp": ts,
+            "ear": e,
+            "mar": m,
+            "speed": None,
+            "confidence": None,
+        }
+        for e, m, ts in zip(ear_values, mar_values, timestamps)
+    ]
+    ids = await run_in_threadpool(telemetry.insert_log_batch, db, rows)
+    return {"ok": True, "frames": n, "first_log_id": ids[0] if ids else None, "ear": ear_values, "mar": mar_values}
+
+
+@router.get("/api/logs")
+def list_logs(
+    driver_id: Optional[int] = None,
+    event_type: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    ear_min: Optional[float] = None,
+    ear_max: Optional[float] = None,
+    mar_min: Optional[float] = None,
+    mar_max: Optional[float] = None,
+    speed_min: Optional[float] = None,
+    speed_max: Optional[float] = None,
+    confidence_min: Optional[float] = None,
+    confidence_max: Optional[float] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(log_query.DEFAULT_PAGE_SIZE, ge=1, le=log_query.MAX_PAGE_SIZE),
+    db: Session = Depends(get_db)
+):
+    # Newest first; pass next_cursor back as ?cursor= to get the following page.
+    # *_min / *_max filter on the typed metric columns (min inclusive, max exclusive)
+    bounds = {
+        "ear": (ear_min, ear_max),
+        "mar": (mar_min, mar_max),
+        "speed": (speed_min, speed_max),
+        "confidence": (confidence_min, confidence_max),
+    }
+    filters = {
+        "driver_id": driver_id,
+        "event_type": event_type,
+        "start": telemetry.to_utc_naive(start) if start else None,
+        "end": telemetry.to_utc_naive(end) if end else None,
+        "metric_ranges": {k: v for k, v in bounds.items() if v != (None, None)},
+    }
+    try:
+        rows, next_cursor = log_query.fetch_page(db, limit=limit, cursor=cursor, **filters)
+    except log_query.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "ok": True,
+        "items": [log_query.serialize(r) for r in rows],
+        "next_cursor": next_cursor,
+        "approx_total": log_query.approximate_count(db, **filters),
+    }
 
 
-@app.post("/api/driver/log")
-def driver_log(token: str = Form(...), driver_id: int = Form(...), event_type: str = Form(...), data: str = Form(None), db: Session = Depends(get_db)):
-    log = LogEntry(driver_id=driver_id, event_type=event_type, data=data or "{}")
-    db.add(log)
-    db.commit()
-    db.refresh(log)
-    return {"ok": True, "log_id": log.id}
-@app.get("/logout")
+@router.get("/api/logs/retention")
+def logs_retention():
+    return {"ok": True, **retention.worker.stats()}
+
+
+@router.get("/api/logs/export")
+def export_logs(
+    fmt: str = Query("csv", alias="format", pattern="^(csv|parquet)$"),
+    driver_id: Optional[int] = None,
+    event_type: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    markers: bool = True,
+):
+    """
+    Stream matching logs oldest first. CSV batches end with a
+    '#cursor,<token>' row (markers=false turns them off): to resume an
+    interrupted download, keep the file up to the last marker and request
+    again with ?cursor=<token>; the CSV header is then omitted. A partial
+    Parquet file has no footer and can't be resumed.
+    """
+    try:
+        if cursor:
+            log_query.decode_cursor(cursor)
+        if fmt == "parquet":
+            export.parquet_schema()
+    except log_query.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except export.ExportUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    chunks = export.stream(
+        fmt, cursor=cursor, driver_id=driver_id, event_type=event_type,
+        start=telemetry.to_utc_naive(start) if start else None,
+        end=telemetry.to_utc_naive(end) if end else None, markers=markers,
+    )
+    headers = {"Content-Disposition": f'attachment; filename="logs.{fmt}"'}
+    return StreamingResponse(chunks, media_type=export.MEDIA_TYPES[fmt], headers=headers)
+
+
+@router.get("/api/logs/series")
+def logs_series(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    driver_id: Optional[int] = None,
+    event_type: Optional[str] = None,
+    points: int = Query(rollups.DEFAULT_POINTS, ge=1, le=rollups.MAX_POINTS),
+    resolution: Optional[str] = Query(None, pattern="^(minute|hour|day)$"),
+    db: Session = Depends(get_db)
+):
+    # Downsampled EAR/MAR series served from the rollup tables; defaults to the last 24h
+    end = telemetry.to_utc_naive(end) if end else datetime.utcnow()
+    start = telemetry.to_utc_naive(start) if start else end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    series = rollups.query_series(db, start, end, driver_id=driver_id, event_type=event_type,
+                                  points=points, resolution=resolution)
+    return {"ok": True, "start": start.isoformat(), "end": end.isoformat(), **series}
+
+
+# --- Live push ---
+# Both channels stream {"type": "driver" | "metrics" | "log" | "dropped", ...} messages,
+# optionally filtered with ?driver_id=1&driver_id=2
+
+@router.websocket("/ws/live")
+async def live_ws(websocket: WebSocket, driver_id: Optional[List[int]] = Query(None)):
+    await websocket.accept()
+    sub = live.broker.subscribe(driver_id)
+
+    async def watch_disconnect():
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        while True:
+            getter = asyncio.create_task(sub.get(timeout=live.KEEPALIVE_SECONDS))
+            done, _ = await asyncio.wait({getter, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if watcher in done:
+                getter.cancel()
+                break
+            await websocket.send_json({"messages": getter.result()})
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        watcher.cancel()
+        live.broker.unsubscribe(sub)
+
+
+@router.get("/api/live/stream")
+async def live_sse(request: Request, driver_id: Optional[List[int]] = Query(None)):
+    sub = live.broker.subscribe(driver_id)
+
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                messages = await sub.get(timeout=live.KEEPALIVE_SECONDS)
+                if not messages:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps(messages, default=str)}\n\n"
+        finally:
+            live.broker.unsubscribe(sub)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.get("/logout")
 async def logout():
     # Frontend will clear localStorage and redirect to login
     return {"ok": True, "message": "Logged out"}
-@app.get("/forgot", response_class=HTMLResponse)
+@router.get("/forgot", response_class=HTMLResponse)
 async def forgot_page(request: Request):
     return templates.TemplateResponse("forgot.html", {"request": request})
 
-@app.get("/verify-reset", response_class=HTMLResponse)
+@router.get("/verify-reset", response_class=HTMLResponse)
 async def page_verify_reset(request: Request):
-    return templates.TemplateResponse("verify-reset.html", {"request": request})
+    return page_cache.render(request, "verify-reset.html")
 
-@app.get("/reset-password", response_class=HTMLResponse)
+@router.get("/reset-password", response_class=HTMLResponse)
 async def page_reset_password(request: Request):
-    return templates.TemplateResponse("reset-password.html", {"request": request})
-@app.get("/forgot-password", response_class=HTMLResponse)
+    return page_cache.render(request, "reset-password.html")
+@router.get("/forgot-password", response_class=HTMLResponse)
 async def forgot_password_page(request: Request):
-    return templates.TemplateResponse("forgot_password.html", {"request": request})
\ No newline at end of file
+    return page_cache.render(request, "forgot_password.html")
+
+
+def create_app() -> FastAPI:
+    """
+    Build the ASGI app. Importing this module does no database or network
+    work; schema checks and background workers run in the lifespan.
+    """
+    metrics.instrument_engines()
+    app = FastAPI(title="Vehicle Safety - Web Frontend", lifespan=lifespan)
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.add_exception_handler(HasherBusy, hasher_busy_handler)
+    app.mount("/static", static_files, name="static")
+    app.include_router(router)
+    return app
+
+
+app = create_app()
+
+
+_STARTUP_PROBE = """
+import json, time, sys
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+app = main.create_app()
+t2 = time.perf_counter()
+import anyio
+async def run():
+    async with app.router.lifespan_context(app):
+        t3 = time.perf_counter()
+        print("STARTUP " + json.dumps({"import_s": t1 - t0, "create_app_s": t2 - t1, "lifespan_s": t3 - t2}))
+anyio.run(run)
+"""
+
+
+def measure_startup(runs: int = 5) -> dict:
+    """Cold-start timings over fresh interpreters: import, create_app(), lifespan startup and the whole process."""
+    import statistics
+    import subprocess
+    import sys
+    import time
+
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", _STARTUP_PROBE], capture_output=True, text=True, check=True)
+        line = next(l for l in out.stdout.splitlines() if l.startswith("STARTUP "))
+        sample = json.loads(line[len("STARTUP "):])
+        sample["process_s"] = time.perf_counter() - started
+        samples.append(sample)
+    return {
+        phase: {"median_ms": round(statistics.median(s[phase] for s in samples) * 1000, 1),
+                "max_ms": round(max(s[phase] for s in samples) * 1000, 1)}
+        for phase in ("import_s", "create_app_s", "lifespan_s", "process_s")
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure cold-start time of the web app (run from the repo root)")
+    parser.add_argument("--startup-time", action="store_true", required=True)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to start")
+    parser.add_argument("--json", action="store_true", help="print timings as JSON")
+    args = parser.parse_args()
+    result = measure_startup(args.runs)
+    if args.json:
+        print(json.dumps(result))
+    else:
+        for phase, t in result.items():
+            print(f"{phase[:-2]:>12}  median {t['median_ms']:>8.1f} ms   max {t['max_ms']:>8.1f} ms")
@@ -0,0 +1,258 @@
+# metrics.py
+# In-process metrics in the Prometheus text format: HTTP route latency and
+# status codes (ASGI middleware), per-statement database timing with slow
+# query samples (SQLAlchemy events), and gauges collected from the stats()
+# of the hasher, mailer, log writer and friends at scrape time.
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_SAMPLES = int(os.environ.get("SLOW_QUERY_SAMPLES", "50"))
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._gauges: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._buckets: Dict[str, tuple] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Tuple[str, Callable[[], dict]]] = []
+
+    def describe(self, name: str, text: str):
+        self._help[name] = text
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1.0):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0.0) + value
+
+    def set(self, name: str, value: float, labels: Labels = ()):
+        with self._lock:
+            self._gauges.setdefault(name, {})[labels] = value
+
+    def add(self, name: str, value: float, labels: Labels = ()):
+        """Move a gauge up or down by value."""
+        with self._lock:
+            series = self._gauges.setdefault(name, {})
+            series[labels] = series.get(labels, 0.0) + value
+
+    def observe(self, name: str, value: float, labels: Labels = (), buckets=HTTP_BUCKETS):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(labels)
+            if hist is None:
+                hist = series[labels] = Histogram(self._buckets.setdefault(name, buckets))
+            hist.observe(value)
+
+    def add_collector(self, prefix: str, fn: Callable[[], dict]):
+        """fn() -> stats dict; its numeric values are exported as {prefix}_{key} gauges."""
+        self._collectors.append((prefix, fn))
+
+    def _collect(self):
+        for prefix, fn in self._collectors:
+            try:
+                stats = fn() or {}
+            except Exception as e:
+                print(f"Metrics Collector Error ({prefix}): {e}")
+                continue
+            for key, value in stats.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    self.set(f"{prefix}_{key}", value)
+
+    def render(self) -> str:
+        self._collect()
+        lines: List[str] = []
+        with self._lock:
+            for kind, store in (("counter", self._counters), ("gauge", self._gauges)):
+                for name in sorted(store):
+                    if name in self._help:
+                        lines.append(f"# HELP {name} {self._help[name]}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for labels, value in store[name].items():
+                        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+            for name in sorted(self._histograms):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, hist in self._histograms[name].items():
+                    running = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        running += count
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', f'{bound:g}'),))} {running}")
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {hist.count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {hist.sum:.6f}")
+                    lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+registry.describe("http_requests_total", "HTTP responses by route, method and status code")
+registry.describe("http_request_duration_seconds", "HTTP request latency by route")
+registry.describe("http_requests_in_flight", "HTTP requests currently being handled")
+registry.describe("db_statement_duration_seconds", "Database statement latency by statement kind")
+registry.describe("db_errors_total", "Database errors by exception type")
+registry.describe("db_slow_statements_total", f"Statements slower than SLOW_QUERY_MS ({SLOW_QUERY_MS:g} ms)")
+registry.describe("threadpool_busy", "Worker threads in use by sync endpoints and run_in_threadpool")
+registry.describe("threadpool_size", "Worker thread limit for sync endpoints and run_in_threadpool")
+registry.describe("threadpool_waiting", "Tasks queued for a worker thread")
+
+
+# --- HTTP ---
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if getattr(route, "path", None):
+        return route.path
+    if scope.get("endpoint") is not None and "app_root_path" in scope:
+        # Mounted app (e.g. /static): the router moved the mount prefix onto root_path
+        prefix = scope.get("root_path", "")[len(scope["app_root_path"]):]
+        if prefix:
+            return prefix + "/{path}"
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request, labelled by route template rather than raw path."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        registry.add("http_requests_in_flight", 1)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            registry.add("http_requests_in_flight", -1)
+            path = _route_label(scope)
+            method = scope.get("method", "")
+            registry.observe("http_request_duration_seconds", elapsed, (("method", method), ("route", path)))
+            registry.inc("http_requests_total", (("method", method), ("route", path), ("status", str(status["code"]))))
+
+
+# --- database ---
+
+_slow: deque = deque(maxlen=SLOW_QUERY_SAMPLES)
+
+
+def _kind(statement: str) -> str:
+    head = statement.lstrip()[:8].split(None, 1)
+    word = head[0].upper() if head else ""
+    return word if word in ("SELECT", "INSERT", "UPDATE", "DELETE", "PRAGMA", "BEGIN", "COMMIT") else "OTHER"
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    registry.observe("db_statement_duration_seconds", elapsed, (("kind", _kind(statement)),), buckets=DB_BUCKETS)
+    if elapsed * 1000.0 >= SLOW_QUERY_MS:
+        registry.inc("db_slow_statements_total")
+        _slow.append({
+            "ms": round(elapsed * 1000.0, 3),
+            "statement": " ".join(statement.split())[:500],
+            "executemany": bool(executemany),
+            "rows": len(parameters) if executemany and hasattr(parameters, "__len__") else None,
+            "database": conn.engine.url.database,
+            "at": time.time(),
+        })
+
+
+def _on_error(context):
+    starts = context.connection.info.get("query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+    registry.inc("db_errors_total", (("type", type(context.original_exception).__name__),))
+
+
+def instrument_engines():
+    """Hook every Engine (main database and archive partitions) once."""
+    if not event.contains(Engine, "before_cursor_execute", _before_execute):
+        event.listen(Engine, "before_cursor_execute", _before_execute)
+        event.listen(Engine, "after_cursor_execute", _after_execute)
+        event.listen(Engine, "handle_error", _on_error)
+
+
+def slow_queries() -> List[dict]:
+    """Most recent slow statements, slowest first."""
+    return sorted(_slow, key=lambda s: s["ms"], reverse=True)
+
+
+# --- threadpool ---
+
+def sample_threadpool(limiter=None):
+    """Gauge the AnyIO thread limiter behind sync endpoints; call from the event loop."""
+    if limiter is None:
+        from anyio import to_thread
+        limiter = to_thread.current_default_thread_limiter()
+    registry.set("threadpool_busy", limiter.borrowed_tokens)
+    registry.set("threadpool_size", limiter.total_tokens)
+    registry.set("threadpool_waiting", limiter.statistics().tasks_waiting)
+
+
+def render() -> str:
+    sample_threadpool()
+    return registry.render()
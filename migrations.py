@@ -0,0 +1,251 @@
+# migrations.py
+import argparse
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from sqlalchemy import bindparam, func, inspect, select, update
+from sqlalchemy.engine import Engine
+
+import telemetry
+from database import Base
+from models import LogEntry, MigrationState
+
+BACKFILL_BATCH = int(os.environ.get("MIGRATION_BACKFILL_BATCH", "5000"))
+# Pause between batches so live ingest is not starved of the write lock
+BACKFILL_PAUSE_S = float(os.environ.get("MIGRATION_BACKFILL_PAUSE_S", "0.01"))
+BACKFILL_DONE = -1
+SCHEMA_MARK = "schema"
+
+
+def ensure_indexes(engine: Engine):
+    """
+    create_all() only creates indexes together with new tables, so indexes
+    added to models later are created here for databases that already exist.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def ensure_columns(engine: Engine):
+    """
+    Add columns that exist on the models but not in the database yet.
+    Only nullable columns (or ones with a server default) can be added this way.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    print(f"[Migrations] Cannot add NOT NULL column {table.name}.{column.name} without a server default")
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+                if column.server_default is not None:
+                    arg = column.server_default.arg
+                    if isinstance(arg, str):
+                        ddl += " DEFAULT '" + arg.replace("'", "''") + "'"
+                    else:
+                        ddl += f" DEFAULT {arg.compile(dialect=engine.dialect)}"
+                conn.exec_driver_sql(ddl)
+                print(f"[Migrations] Added column {table.name}.{column.name}")
+
+
+def _get_mark(conn, name: str) -> int:
+    return conn.scalar(select(MigrationState.value).where(MigrationState.name == name)) or 0
+
+
+def _set_mark(conn, name: str, value: int):
+    if conn.execute(update(MigrationState).where(MigrationState.name == name).values(value=value)).rowcount == 0:
+        conn.execute(MigrationState.__table__.insert().values(name=name, value=value))
+
+
+def backfill_log_fields(engine: Engine, batch_size: int = BACKFILL_BATCH,
+                        stop: Optional[threading.Event] = None) -> int:
+    """
+    Copy the typed fields (ear, mar, ...) out of LogEntry.data for rows
+    stored before those columns existed. Runs in id order, one committed
+    batch at a time, and records its progress so it resumes where it
+    stopped (also when `stop` is set); once finished it is a single lookup.
+    Rows ingested meanwhile already carry the fields. Returns rows updated.
+    """
+    name = "logs_typed_fields"
+    stop = stop or threading.Event()
+    table = LogEntry.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("_id"))
+        .values({f: bindparam(f"v_{f}") for f in telemetry.TYPED_FIELDS})
+    )
+    with engine.connect() as conn:
+        last_id = _get_mark(conn, name)
+        if last_id == BACKFILL_DONE:
+            return 0
+        max_id = conn.scalar(select(func.max(table.c.id))) or 0
+    updated = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.data)
+                .where(table.c.id > last_id, table.c.id <= max_id)
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                _set_mark(conn, name, BACKFILL_DONE)
+                break
+            params = []
+            for log_id, data in rows:
+                fields = telemetry.typed_fields(telemetry.decode_data(data))
+                if any(v is not None for v in fields.values()):
+                    params.append({"_id": log_id, **{f"v_{f}": v for f, v in fields.items()}})
+            if params:
+                conn.execute(stmt, params)
+            last_id = rows[-1][0]
+            _set_mark(conn, name, last_id)
+        updated += len(params)
+        if stop.wait(BACKFILL_PAUSE_S):
+            break
+    if updated:
+        print(f"[Migrations] Backfilled typed fields on {updated} log rows")
+    return updated
+
+
+def schema_version() -> int:
+    """Fingerprint of the tables, columns and indexes declared on the models."""
+    h = hashlib.sha1()
+    for table in Base.metadata.sorted_tables:
+        h.update(table.name.encode())
+        for column in table.columns:
+            h.update(f"|{column.name}:{column.type}:{column.nullable}".encode())
+        for index in sorted(table.indexes, key=lambda i: i.name or ""):
+            h.update(f"|ix:{index.name}".encode())
+    return int(h.hexdigest()[:7], 16)
+
+
+def is_current(engine: Engine) -> bool:
+    # One indexed lookup. A fresh database has no migration_state table yet; check for it
+    # rather than catching the failed query, which would show up in db_errors_total
+    with engine.connect() as conn:
+        if not inspect(conn).has_table(MigrationState.__tablename__):
+            return False
+        return _get_mark(conn, SCHEMA_MARK) == schema_version()
+
+
+@contextmanager
+def _upgrade_lock(engine: Engine, kind: str = "migrate", blocking: bool = True):
+    """
+    Serialize upgrades between worker processes on this host (no-op where
+    fcntl is unavailable). Yields False if blocking=False and another
+    process holds the lock.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield True
+        return
+    database = engine.url.database if engine.dialect.name == "sqlite" else None
+    path = os.environ.get("MIGRATION_LOCK_FILE") or (
+        f"{database}.migrate.lock" if database and database != ":memory:" else ".migrate.lock"
+    )
+    if kind != "migrate":
+        path = f"{path[:-len('.migrate.lock')] if path.endswith('.migrate.lock') else path}.{kind}.lock"
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def upgrade(engine: Engine):
+    # Create missing tables, then bring existing ones up to date (safe to call on every start).
+    # Data backfills are left to Backfiller / the CLI so startup doesn't wait on them.
+    Base.metadata.create_all(bind=engine)
+    ensure_columns(engine)
+    ensure_indexes(engine)
+    with engine.begin() as conn:
+        _set_mark(conn, SCHEMA_MARK, schema_version())
+
+
+def ensure_schema(engine: Engine) -> bool:
+    """
+    Upgrade only if the database was not already brought up to this code's
+    schema. The first worker to start does the work under a file lock;
+    the others wait for it and then see the recorded version. Returns True
+    if this call ran the upgrade.
+    """
+    if is_current(engine):
+        return False
+    with _upgrade_lock(engine):
+        if is_current(engine):
+            return False
+        upgrade(engine)
+    return True
+
+
+class Backfiller:
+    """
+    Runs the log-field backfill on a background thread after startup. Only
+    one worker process per host does it (the others find the lock held and
+    skip); progress is recorded, so a restart picks up where it stopped.
+    """
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.updated = 0
+        self.finished = False
+
+    def start(self, engine: Engine):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(engine,), name="log-backfill", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+            self._thread = None
+
+    def _run(self, engine: Engine):
+        try:
+            with _upgrade_lock(engine, "backfill", blocking=False) as acquired:
+                if acquired:
+                    self.updated += backfill_log_fields(engine, stop=self._stop)
+                    self.finished = not self._stop.is_set()
+        except Exception as e:
+            print(f"Backfill Error: {e}")
+
+
+backfiller = Backfiller()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bring the database schema up to date")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH, help="rows per backfill batch")
+    args = parser.parse_args()
+    from database import engine
+    Base.metadata.create_all(bind=engine)
+    ensure_columns(engine)
+    ensure_indexes(engine)
+    started = time.perf_counter()
+    count = backfill_log_fields(engine, args.batch_size)
+    with engine.begin() as connection:
+        _set_mark(connection, SCHEMA_MARK, schema_version())
+    print(f"Backfilled {count} log rows in {time.perf_counter() - started:.2f}s")
@@ -1,9 +1,9 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Float, Index
 from sqlalchemy.sql import func
 from database import Base
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field
+from typing import Optional, Union
 import datetime
 
 class User(Base):
@@ -25,15 +25,63 @@ class OTP(Base):
     expiry = Column(DateTime, nullable=False)
     purpose = Column(String(32), nullable=False)  # 'register' or 'reset'
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    consumed_at = Column(DateTime, nullable=True)  # set once the code has been used
+    __table_args__ = (
+        # Matches the verify lookup: email + purpose + code, newest id first
+        Index("ix_otps_lookup", "email", "purpose", "code", "id"),
+        # Range scans for the background purge, see otps.py
+        Index("ix_otps_expiry", "expiry"),
+        Index("ix_otps_consumed_at", "consumed_at"),
+    )
 
 class DriverProfile(Base):
     __tablename__ = "drivers"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False, default=0)  # 0 when not linked to a user account
     name = Column(String(128))
     phone = Column(String(32))
     vehicle_no = Column(String(32))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Fleet registry fields, see drivers.py
+    license = Column(String(64), nullable=True)
+    status = Column(String(64), nullable=True)
+    status_color = Column(String(16), nullable=True)
+    bg_color = Column(String(16), nullable=True)
+    shift_start = Column(String(16), nullable=True)
+    drive_time = Column(String(32), nullable=True)
+    distance = Column(String(32), nullable=True)
+    photo = Column(String(256), nullable=True)
+    # Live fields
+    score = Column(Float, nullable=True)
+    ear = Column(Float, nullable=True)
+    mar = Column(Float, nullable=True)
+    auth_status = Column(String(32), nullable=True)
+    face_confidence = Column(Float, nullable=True)
+    last_verified = Column(String(64), nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+
+class LogPartition(Base):
+    # Catalog of archived log partitions (one SQLite file per month), see retention.py
+    __tablename__ = "log_partitions"
+    name = Column(String(16), primary_key=True)  # 'YYYY-MM'
+    path = Column(String(512), nullable=False)
+    row_count = Column(Integer, nullable=False, default=0)
+    min_ts = Column(DateTime)
+    max_ts = Column(DateTime)
+    updated_at = Column(DateTime)
+
+class MigrationState(Base):
+    # Progress markers for data migrations that run in batches, see migrations.py
+    __tablename__ = "migration_state"
+    name = Column(String(64), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+class CacheVersion(Base):
+    # Bumped in the same transaction as writes to a cached table, so every
+    # worker can tell when its in-memory copy is stale
+    __tablename__ = "cache_versions"
+    name = Column(String(64), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
 
 class LogEntry(Base):
     __tablename__ = "logs"
@@ -42,6 +90,56 @@ class LogEntry(Base):
     event_type = Column(String(64))
     data = Column(Text)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    # Hot numeric fields of data, copied out on ingest so they can be filtered in SQL
+    ear = Column(Float)
+    mar = Column(Float)
+    speed = Column(Float)
+    confidence = Column(Float)
+    # Composite indexes backing keyset pagination on (timestamp, id), see log_query.py
+    __table_args__ = (
+        Index("ix_logs_timestamp_id", "timestamp", "id"),
+        Index("ix_logs_driver_timestamp_id", "driver_id", "timestamp", "id"),
+        Index("ix_logs_event_timestamp_id", "event_type", "timestamp", "id"),
+        # Partial: most events carry no metrics, so only rows that do are indexed
+        *(
+            Index(f"ix_logs_{m}_timestamp", m, "timestamp",
+                  sqlite_where=Column(m).isnot(None), postgresql_where=Column(m).isnot(None))
+            for m in ("ear", "mar", "speed", "confidence")
+        ),
+    )
+
+class LogRollup(Base):
+    # Pre-aggregated LogEntry stats per (resolution, bucket, driver, event type),
+    # maintained incrementally on ingest by rollups.py
+    __tablename__ = "log_rollups"
+    id = Column(Integer, primary_key=True)
+    resolution = Column(String(8), nullable=False)  # 'minute', 'hour' or 'day'
+    bucket = Column(DateTime, nullable=False)  # bucket start, naive UTC
+    driver_id = Column(Integer, nullable=False)  # 0 for events without a driver
+    event_type = Column(String(64), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    ear_count = Column(Integer, nullable=False, default=0)
+    ear_sum = Column(Float, nullable=False, default=0.0)
+    ear_min = Column(Float)
+    ear_max = Column(Float)
+    mar_count = Column(Integer, nullable=False, default=0)
+    mar_sum = Column(Float, nullable=False, default=0.0)
+    mar_min = Column(Float)
+    mar_max = Column(Float)
+    __table_args__ = (
+        Index("ux_log_rollups_key", "resolution", "driver_id", "event_type", "bucket", unique=True),
+        Index("ix_log_rollups_driver_bucket", "resolution", "driver_id", "bucket"),
+        Index("ix_log_rollups_bucket", "resolution", "bucket"),
+    )
+
+class DriverScore(Base):
+    # Decayed alert counters behind drivers.score, updated per event on ingest, see scoring.py
+    __tablename__ = "driver_scores"
+    driver_id = Column(Integer, primary_key=True)
+    drowsy = Column(Float, nullable=False, default=0.0)
+    yawn = Column(Float, nullable=False, default=0.0)
+    face_fail = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(Float, nullable=False, default=0.0)  # the counters' reference time, epoch seconds
 
 # Pydantic schemas
 class UserCreate(BaseModel):
@@ -56,4 +154,10 @@ class UserOut(BaseModel):
     is_verified: bool
     is_admin: bool
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class LogEventIn(BaseModel):
+    driver_id: int
+    event_type: str = Field(..., min_length=1, max_length=64)
+    data: Optional[Union[dict, str]] = None
+    timestamp: Optional[datetime.datetime] = None
\ No newline at end of file
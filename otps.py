@@ -0,0 +1,106 @@
+# otps.py
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import OTP
+
+OTP_PURGE_INTERVAL_S = float(os.environ.get("OTP_PURGE_INTERVAL_S", "300"))
+OTP_PURGE_BATCH = int(os.environ.get("OTP_PURGE_BATCH", "500"))
+# Pause between delete batches so registrations never wait long on the write lock
+OTP_PURGE_PAUSE_S = float(os.environ.get("OTP_PURGE_PAUSE_S", "0.05"))
+# Keep expired/consumed rows a little while for support and auditing
+OTP_PURGE_GRACE = timedelta(minutes=int(os.environ.get("OTP_PURGE_GRACE_MIN", "60")))
+
+
+def find_active(db: Session, email: str, code: str, purpose: str) -> Optional[OTP]:
+    """Newest unused OTP for this email/code/purpose (served by ix_otps_lookup)."""
+    return (
+        db.query(OTP)
+        .filter(OTP.email == email, OTP.purpose == purpose, OTP.code == code, OTP.consumed_at.is_(None))
+        .order_by(OTP.id.desc())
+        .first()
+    )
+
+
+def consume(db: Session, otp: OTP) -> bool:
+    """
+    Mark an OTP as used. Conditional on it still being unused, so two
+    concurrent requests with the same code cannot both succeed. Not committed.
+    """
+    result = db.execute(
+        update(OTP)
+        .where(OTP.id == otp.id, OTP.consumed_at.is_(None))
+        .values(consumed_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def _delete_batch(db: Session, condition) -> int:
+    ids = select(OTP.id).where(condition).limit(OTP_PURGE_BATCH).scalar_subquery()
+    result = db.execute(delete(OTP).where(OTP.id.in_(ids)).execution_options(synchronize_session=False))
+    db.commit()
+    return result.rowcount
+
+
+def purge(db: Session, now: Optional[datetime] = None) -> int:
+    """Delete expired or consumed OTPs older than the grace period, in small batches."""
+    cutoff = (now or datetime.utcnow()) - OTP_PURGE_GRACE
+    total = 0
+    for condition in (OTP.expiry < cutoff, OTP.consumed_at < cutoff):
+        while True:
+            deleted = _delete_batch(db, condition)
+            total += deleted
+            if deleted < OTP_PURGE_BATCH:
+                break
+            time.sleep(OTP_PURGE_PAUSE_S)
+    return total
+
+
+class OTPPurger:
+    def __init__(self, interval: float = OTP_PURGE_INTERVAL_S, session_factory=SessionLocal):
+        self.interval = interval
+        self.session_factory = session_factory
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_run: Optional[datetime] = None
+        self.last_deleted = 0
+        self.total_deleted = 0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="otp-purger", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+            self._thread = None
+
+    def run_once(self) -> int:
+        with self.session_factory() as db:
+            deleted = purge(db)
+        self.last_run = datetime.utcnow()
+        self.last_deleted = deleted
+        self.total_deleted += deleted
+        return deleted
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"OTP Purge Error: {e}")
+
+
+purger = OTPPurger()
@@ -0,0 +1,115 @@
+# pages.py
+# Rendered-page cache for template routes. A page is rendered once per
+# (template, data version, key) and then served from memory with a
+# strong ETag, so repeat views cost a dict lookup and revalidations a 304.
+# Templates are compiled through Jinja's bytecode cache so new workers
+# skip parsing.
+import hashlib
+import os
+from typing import Callable, Hashable, Optional
+
+from fastapi import Request
+from fastapi.responses import HTMLResponse, Response
+from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache
+
+import assets
+from cache import TTLCache
+
+PAGE_CACHE_SIZE = int(os.environ.get("PAGE_CACHE_SIZE", "256"))
+PAGE_CACHE_TTL_S = float(os.environ.get("PAGE_CACHE_TTL_S", "3600"))
+# Lifetime of pages that show live fields (scores, auth status) not covered by their data version
+PAGE_LIVE_TTL_S = float(os.environ.get("PAGE_LIVE_TTL_S", "5"))
+JINJA_CACHE_DIR = os.environ.get("JINJA_CACHE_DIR", "./.jinja_cache")
+# HTML is always revalidated; the ETag makes that a bodyless 304
+CACHE_CONTROL = "no-cache"
+
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+def _matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+
+class PageCache:
+    """
+    Caches rendered template bodies keyed by template name, the asset
+    manifest version, a data version and an optional extra key.
+    Data-backed pages pass the shared version of their data (e.g. the
+    drivers CacheVersion row), so every worker re-renders after the same
+    writes; static pages need none. Fields that change too often to key on
+    get a short per-page ttl instead. Only use it for pages whose output
+    depends on nothing else in the request.
+    """
+
+    def __init__(self, templates: Jinja2Templates, maxsize: int = PAGE_CACHE_SIZE, ttl: float = PAGE_CACHE_TTL_S):
+        self.templates = templates
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.renders = 0
+        self.not_modified = 0
+
+    def _render(self, name: str, context: dict):
+        template = self.templates.get_template(name)
+        body = template.render(context).encode("utf-8")
+        self.renders += 1
+        return body, _etag(body), template
+
+    def render(self, request: Request, name: str, context: Optional[dict] = None,
+               context_fn: Optional[Callable[[], dict]] = None, version: Hashable = None,
+               key: Hashable = None, ttl: Optional[float] = None) -> Response:
+        """
+        Serve template `name`, rendering it only on a cache miss. context_fn
+        is called only when rendering, so expensive lookups are skipped on hits.
+        """
+        cache_key = (name, assets.version(), version, key)
+        entry = self._cache.get(cache_key)
+        if entry is not None and self.templates.env.auto_reload and not entry[2].is_up_to_date:
+            entry = None  # template edited on disk
+        if entry is None:
+            ctx = {"request": request}
+            ctx.update(context or {})
+            if context_fn is not None:
+                ctx.update(context_fn())
+            entry = self._render(name, ctx)
+            self._cache.set(cache_key, entry, ttl)
+        body, etag, _ = entry
+        headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+        if _matches(request.headers.get("if-none-match"), etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return HTMLResponse(body, headers=headers)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "renders": self.renders, "not_modified": self.not_modified}
+
+
+def bytecode_cache(directory: str = JINJA_CACHE_DIR) -> Optional[FileSystemBytecodeCache]:
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        print(f"Jinja Cache Error: {e}")
+        return None
+    return FileSystemBytecodeCache(directory)
+
+
+def warm(templates: Jinja2Templates) -> int:
+    """Compile every template up front (from bytecode when cached). Returns templates loaded."""
+    count = 0
+    for name in templates.env.list_templates(extensions=["html"]):
+        try:
+            templates.get_template(name)
+            count += 1
+        except Exception as e:
+            print(f"Template Warmup Error ({name}): {e}")
+    return count
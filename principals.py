@@ -0,0 +1,48 @@
+# principals.py
+import os
+import time
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from auth import decode_access_token
+from cache import TTLCache
+from models import User, UserOut
+
+# Decoded token -> resolved user snapshot. Entries never outlive the token's
+# exp, and are dropped on profile/password changes in this worker; other
+# workers see such changes after at most PRINCIPAL_CACHE_TTL seconds.
+PRINCIPAL_CACHE_TTL = float(os.environ.get("PRINCIPAL_CACHE_TTL", "30"))
+PRINCIPAL_CACHE_SIZE = int(os.environ.get("PRINCIPAL_CACHE_SIZE", "10000"))
+
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+
+def resolve(token: str, db: Session) -> Optional[UserOut]:
+    """Return the user a bearer token belongs to, or None if the token or user is invalid."""
+    if not token:
+        return None
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+    payload = decode_access_token(token)
+    if not payload or not payload.get("sub"):
+        return None
+    user = db.query(User).filter(User.email == payload["sub"]).first()
+    if not user:
+        return None
+    principal = UserOut(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        is_verified=bool(user.is_verified),
+        is_admin=bool(user.is_admin),
+    )
+    exp = payload.get("exp")
+    ttl = exp - time.time() if isinstance(exp, (int, float)) else None
+    principal_cache.set(token, principal, ttl=ttl)
+    return principal
+
+
+def invalidate_user(user_id: int) -> int:
+    return principal_cache.discard_where(lambda _token, p: p.id == user_id)
@@ -0,0 +1,248 @@
+# retention.py
+import argparse
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+import migrations
+from database import SessionLocal, make_engine
+from models import LogEntry, LogPartition, LogRollup
+
+# Logs older than this many days move out of the hot table (0 disables archiving)
+LOG_RETENTION_DAYS = int(os.environ.get("LOG_RETENTION_DAYS", "30"))
+LOG_ARCHIVE_DIR = os.environ.get("LOG_ARCHIVE_DIR", "./archive")
+RETENTION_BATCH = int(os.environ.get("RETENTION_BATCH", "2000"))
+# Pause between batches so ingest is never blocked on the write lock for long
+RETENTION_PAUSE_S = float(os.environ.get("RETENTION_PAUSE_S", "0.05"))
+RETENTION_INTERVAL_S = float(os.environ.get("RETENTION_INTERVAL_S", "3600"))
+
+_engines: Dict[str, Engine] = {}
+_sessions: Dict[str, sessionmaker] = {}
+_lock = threading.Lock()
+
+
+def partition_name(ts: datetime) -> str:
+    return f"{ts.year:04d}-{ts.month:02d}"
+
+
+def partition_path(name: str) -> str:
+    return os.path.join(LOG_ARCHIVE_DIR, f"logs_{name.replace('-', '_')}.db")
+
+
+def partition_engine(name: str, path: Optional[str] = None) -> Engine:
+    """Engine for one monthly archive file, creating the file and its logs table on first use."""
+    eng = _engines.get(name)
+    if eng is not None:
+        return eng
+    with _lock:
+        eng = _engines.get(name)
+        if eng is None:
+            path = path or partition_path(name)
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            eng = make_engine(f"sqlite:///{path}")
+            LogEntry.__table__.create(bind=eng, checkfirst=True)
+            _sessions[name] = sessionmaker(bind=eng, autocommit=False, autoflush=False)
+            _engines[name] = eng
+    return eng
+
+
+def partition_session(part: LogPartition) -> Session:
+    partition_engine(part.name, part.path)
+    return _sessions[part.name]()
+
+
+def partitions_for(db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                   newest_first: bool = False) -> List[LogPartition]:
+    """Archived partitions that may hold rows in [start, end)."""
+    stmt = select(LogPartition).where(LogPartition.row_count > 0)
+    if start is not None:
+        stmt = stmt.where(LogPartition.max_ts >= start)
+    if end is not None:
+        stmt = stmt.where(LogPartition.min_ts < end)
+    order = LogPartition.max_ts.desc() if newest_first else LogPartition.min_ts
+    return list(db.scalars(stmt.order_by(order)))
+
+
+def _record(db: Session, name: str, rows: List[dict], archived: int):
+    part = db.get(LogPartition, name)
+    if part is None:
+        part = LogPartition(name=name, path=partition_path(name), row_count=0)
+        db.add(part)
+    stamps = [r["timestamp"] for r in rows]
+    part.row_count = (part.row_count or 0) + archived
+    part.min_ts = min([t for t in (part.min_ts, *stamps) if t is not None])
+    part.max_ts = max([t for t in (part.max_ts, *stamps) if t is not None])
+    part.updated_at = datetime.utcnow()
+
+
+def archive_batch(db: Session, cutoff: datetime, batch_size: int = RETENTION_BATCH) -> int:
+    """
+    Move the oldest batch of rows older than cutoff into their monthly
+    partition files. Rows are committed to the archive before they are
+    deleted from the hot table, and archive inserts ignore ids already
+    present, so a crash in between only repeats work: the partition's
+    row_count grows by the rows of the batch found in the file afterwards,
+    not by what this insert added. archive() holds the retention lock, so
+    no two processes move the same batch. Returns rows moved.
+    """
+    table = LogEntry.__table__
+    rows = [
+        dict(r) for r in db.execute(
+            select(table).where(table.c.timestamp < cutoff)
+            .order_by(table.c.timestamp, table.c.id).limit(batch_size)
+        ).mappings()
+    ]
+    if not rows:
+        return 0
+    by_month: Dict[str, List[dict]] = {}
+    for row in rows:
+        by_month.setdefault(partition_name(row["timestamp"]), []).append(row)
+    try:
+        for name, group in by_month.items():
+            ids = [r["id"] for r in group]
+            with partition_engine(name).begin() as conn:
+                conn.execute(sqlite.insert(table).prefix_with("OR IGNORE"), group)
+                # Rows an interrupted earlier run already archived count too
+                archived = conn.scalar(select(func.count()).select_from(table).where(table.c.id.in_(ids)))
+            if archived != len(group):
+                raise RuntimeError(f"Partition {name} holds {archived} of {len(group)} archived rows")
+            _record(db, name, group, archived)
+        db.execute(
+            delete(table).where(table.c.id.in_([r["id"] for r in rows]))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(rows)
+
+
+def archive(db: Session, older_than_days: int = LOG_RETENTION_DAYS, batch_size: int = RETENTION_BATCH,
+            now: Optional[datetime] = None, blocking: bool = True) -> Optional[int]:
+    """
+    Archive everything older than the retention window, in small batches.
+    Only one process archives at a time; with blocking=False this returns
+    None when another one is already at it.
+    """
+    if older_than_days <= 0:
+        return 0
+    with migrations._upgrade_lock(db.get_bind(), "retention", blocking=blocking) as acquired:
+        if not acquired:
+            return None
+        return _archive(db, older_than_days, batch_size, now)
+
+
+def _archive(db: Session, older_than_days: int, batch_size: int, now: Optional[datetime]) -> int:
+    # Cut at midnight so every run archives whole days
+    cutoff = (now or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+    cutoff -= timedelta(days=older_than_days)
+    total = 0
+    while True:
+        moved = archive_batch(db, cutoff, batch_size)
+        total += moved
+        if moved < batch_size:
+            break
+        time.sleep(RETENTION_PAUSE_S)
+    if total and db.get_bind().dialect.name == "sqlite":
+        # Refresh planner stats now that the hot table shrank; freed pages are reused by new rows
+        db.execute(text("PRAGMA optimize"))
+    return total
+
+
+class RetentionWorker:
+    def __init__(self, interval: float = RETENTION_INTERVAL_S, session_factory=SessionLocal):
+        self.interval = interval
+        self.session_factory = session_factory
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_run: Optional[datetime] = None
+        self.last_archived = 0
+        self.total_archived = 0
+
+    def start(self):
+        if LOG_RETENTION_DAYS <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="log-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+            self._thread = None
+
+    def run_once(self) -> int:
+        with self.session_factory() as db:
+            # Every worker process runs this thread; the one holding the lock does the work
+            archived = archive(db, blocking=False)
+        if archived is None:
+            return 0
+        self.last_run = datetime.utcnow()
+        self.last_archived = archived
+        self.total_archived += archived
+        return archived
+
+    def _run(self):
+        # First pass shortly after startup, then every interval
+        wait = min(self.interval, 60.0)
+        while not self._stop.wait(wait):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Log Retention Error: {e}")
+            wait = self.interval
+
+    def stats(self) -> dict:
+        with self.session_factory() as db:
+            parts = db.scalars(select(LogPartition).order_by(LogPartition.name)).all()
+            # Approximate: every row ever ingested (daily rollups) minus what was archived,
+            # instead of a COUNT(*) scan over the hot table on each call
+            ingested = db.scalar(
+                select(func.coalesce(func.sum(LogRollup.count), 0)).where(LogRollup.resolution == "day")
+            )
+        archived_rows = sum(p.row_count for p in parts)
+        return {
+            "retention_days": LOG_RETENTION_DAYS,
+            "archive_dir": LOG_ARCHIVE_DIR,
+            "hot_rows": max(0, ingested - archived_rows),
+            "hot_rows_approximate": True,
+            "archived_rows": archived_rows,
+            "partitions": [
+                {"name": p.name, "rows": p.row_count,
+                 "min_ts": p.min_ts.isoformat() if p.min_ts else None,
+                 "max_ts": p.max_ts.isoformat() if p.max_ts else None}
+                for p in parts
+            ],
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "last_archived": self.last_archived,
+            "total_archived": self.total_archived,
+        }
+
+
+worker = RetentionWorker()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old logs into monthly partition files")
+    parser.add_argument("--days", type=int, default=LOG_RETENTION_DAYS, help="keep this many days in the hot table")
+    parser.add_argument("--status", action="store_true", help="show partitions and exit")
+    args = parser.parse_args()
+    import migrations
+    from database import engine
+    migrations.ensure_schema(engine)
+    if not args.status:
+        started = time.perf_counter()
+        with SessionLocal() as session:
+            count = archive(session, older_than_days=args.days)
+        print(f"Archived {count} log rows in {time.perf_counter() - started:.2f}s")
+    for p in worker.stats()["partitions"]:
+        print(f"{p['name']}  {p['rows']:>10} rows  {p['min_ts']} .. {p['max_ts']}")
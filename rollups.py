@@ -0,0 +1,194 @@
+# rollups.py
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import retention
+import telemetry
+from models import LogEntry, LogRollup
+
+# (name, bucket width in seconds), finest first
+RESOLUTIONS = [("minute", 60), ("hour", 3600), ("day", 86400)]
+RESOLUTION_SECONDS = dict(RESOLUTIONS)
+DEFAULT_POINTS = 300
+MAX_POINTS = 5000
+
+_METRICS = ("ear", "mar")
+
+
+def bucket_start(ts: datetime, resolution: str) -> datetime:
+    if resolution == "minute":
+        return ts.replace(second=0, microsecond=0)
+    if resolution == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _as_float(value) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return None
+
+
+def aggregate(rows: List[dict]) -> Dict[Tuple, dict]:
+    """Fold raw log rows into per-bucket aggregates for every resolution."""
+    out: Dict[Tuple, dict] = {}
+    for row in rows:
+        ts = row.get("timestamp") or datetime.utcnow()
+        if _METRICS[0] in row:
+            values = {m: row[m] for m in _METRICS}  # typed fields set by insert_log_batch
+        else:
+            data = telemetry.decode_data(row.get("data"))
+            values = {m: _as_float(data.get(m)) for m in _METRICS}
+        driver_id = row.get("driver_id") or 0
+        event_type = row.get("event_type") or ""
+        for resolution, _ in RESOLUTIONS:
+            key = (resolution, bucket_start(ts, resolution), driver_id, event_type)
+            agg = out.get(key)
+            if agg is None:
+                agg = out[key] = {
+                    "resolution": resolution, "bucket": key[1], "driver_id": driver_id,
+                    "event_type": event_type, "count": 0,
+                    "ear_count": 0, "ear_sum": 0.0, "ear_min": None, "ear_max": None,
+                    "mar_count": 0, "mar_sum": 0.0, "mar_min": None, "mar_max": None,
+                }
+            agg["count"] += 1
+            for m, v in values.items():
+                if v is None:
+                    continue
+                agg[f"{m}_count"] += 1
+                agg[f"{m}_sum"] += v
+                lo, hi = agg[f"{m}_min"], agg[f"{m}_max"]
+                agg[f"{m}_min"] = v if lo is None else min(lo, v)
+                agg[f"{m}_max"] = v if hi is None else max(hi, v)
+    return out
+
+
+def _merge(current, incoming, pick):
+    # NULL-safe scalar min/max for the upsert
+    return case((current.is_(None), incoming), (incoming.is_(None), current), else_=pick(current, incoming))
+
+
+def upsert(db: Session, aggregates: List[dict]):
+    if not aggregates:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(LogRollup)
+        least, greatest = func.least, func.greatest
+    else:
+        stmt = sqlite.insert(LogRollup)
+        least, greatest = func.min, func.max
+    t, ex = LogRollup.__table__.c, stmt.excluded
+    updates = {
+        "count": t.count + ex.count,
+        "ear_count": t.ear_count + ex.ear_count,
+        "ear_sum": t.ear_sum + ex.ear_sum,
+        "ear_min": _merge(t.ear_min, ex.ear_min, least),
+        "ear_max": _merge(t.ear_max, ex.ear_max, greatest),
+        "mar_count": t.mar_count + ex.mar_count,
+        "mar_sum": t.mar_sum + ex.mar_sum,
+        "mar_min": _merge(t.mar_min, ex.mar_min, least),
+        "mar_max": _merge(t.mar_max, ex.mar_max, greatest),
+    }
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["resolution", "driver_id", "event_type", "bucket"], set_=updates
+    )
+    db.execute(stmt, aggregates)
+
+
+def apply_rollups(db: Session, rows: List[dict]):
+    upsert(db, list(aggregate(rows).values()))
+
+
+def pick_resolution(start: datetime, end: datetime, points: int) -> str:
+    """Finest resolution whose bucket count for the range fits in the point budget."""
+    span = max((end - start).total_seconds(), 1)
+    for name, seconds in RESOLUTIONS:
+        if span / seconds <= points:
+            return name
+    return RESOLUTIONS[-1][0]
+
+
+def query_series(db: Session, start: datetime, end: datetime, driver_id: Optional[int] = None,
+                 event_type: Optional[str] = None, points: int = DEFAULT_POINTS,
+                 resolution: Optional[str] = None) -> dict:
+    resolution = resolution or pick_resolution(start, end, points)
+    r = LogRollup
+    stmt = (
+        select(
+            r.bucket,
+            func.sum(r.count),
+            func.sum(r.ear_count), func.sum(r.ear_sum), func.min(r.ear_min), func.max(r.ear_max),
+            func.sum(r.mar_count), func.sum(r.mar_sum), func.min(r.mar_min), func.max(r.mar_max),
+        )
+        .where(r.resolution == resolution, r.bucket >= bucket_start(start, resolution), r.bucket < end)
+        .group_by(r.bucket)
+        .order_by(r.bucket)
+    )
+    if driver_id is not None:
+        stmt = stmt.where(r.driver_id == driver_id)
+    if event_type:
+        stmt = stmt.where(r.event_type == event_type)
+    series = []
+    for bucket, count, ec, es, emin, emax, mc, ms, mmin, mmax in db.execute(stmt):
+        series.append({
+            "t": bucket.isoformat() if isinstance(bucket, datetime) else bucket,
+            "count": count,
+            "ear_mean": round(es / ec, 4) if ec else None,
+            "ear_min": emin,
+            "ear_max": emax,
+            "mar_mean": round(ms / mc, 4) if mc else None,
+            "mar_min": mmin,
+            "mar_max": mmax,
+        })
+    return {"resolution": resolution, "bucket_seconds": RESOLUTION_SECONDS[resolution], "points": series}
+
+
+def rebuild(db: Session, batch_size: int = 5000) -> int:
+    """Recompute every rollup from the raw logs, hot and archived, e.g. after a backfill."""
+    db.execute(delete(LogRollup))
+    total = 0
+    stmt = select(LogEntry.driver_id, LogEntry.event_type, LogEntry.timestamp, LogEntry.ear, LogEntry.mar)
+    stmt = stmt.execution_options(yield_per=batch_size)
+    sources = [None] + retention.partitions_for(db)
+    for part in sources:
+        source = db if part is None else retention.partition_session(part)
+        try:
+            batch: List[dict] = []
+            for driver_id, event_type, ts, ear, mar in source.execute(stmt):
+                batch.append({"driver_id": driver_id, "event_type": event_type, "timestamp": ts, "ear": ear, "mar": mar})
+                if len(batch) >= batch_size:
+                    apply_rollups(db, batch)
+                    total += len(batch)
+                    batch = []
+            apply_rollups(db, batch)
+            total += len(batch)
+        finally:
+            if part is not None:
+                source.close()
+    db.commit()
+    return total
+
+
+telemetry.add_batch_hook(apply_rollups)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain LogEntry rollup tables")
+    parser.add_argument("--rebuild", action="store_true", help="recompute all rollups from the logs table")
+    args = parser.parse_args()
+    if args.rebuild:
+        import migrations
+        from database import SessionLocal, engine
+        migrations.ensure_schema(engine)
+        with SessionLocal() as session:
+            print(f"Rebuilt rollups from {rebuild(session)} log rows")
+    else:
+        parser.print_help()
@@ -0,0 +1,269 @@
+# scoring.py
+import argparse
+import math
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import drivers
+import drowsiness
+import live
+import telemetry
+from database import DATABASE_URL, SessionLocal, make_engine
+from models import DriverProfile, DriverScore, LogEntry
+
+# Counters lose half their weight every SCORE_HALF_LIFE_H hours
+SCORE_HALF_LIFE_H = float(os.environ.get("SCORE_HALF_LIFE_H", "8"))
+# Points deducted from 100 per (decayed) event
+WEIGHT_DROWSY = float(os.environ.get("SCORE_WEIGHT_DROWSY", "8"))
+WEIGHT_YAWN = float(os.environ.get("SCORE_WEIGHT_YAWN", "3"))
+WEIGHT_FACE_FAIL = float(os.environ.get("SCORE_WEIGHT_FACE_FAIL", "10"))
+# Events older than this are ignored on a cold-start replay (10 half-lives leave < 0.1% of their weight)
+SCORE_WINDOW_H = float(os.environ.get("SCORE_WINDOW_H", str(SCORE_HALF_LIFE_H * 10)))
+
+FACE_FAIL_EVENTS = ("face_verification_failed",)
+
+# event_type -> counter slot
+EVENT_KINDS = {
+    drowsiness.ALERT_EYES_CLOSED: 0,
+    drowsiness.ALERT_PERCLOS: 0,
+    drowsiness.ALERT_YAWNING: 1,
+    **{e: 2 for e in FACE_FAIL_EVENTS},
+}
+WEIGHTS = (WEIGHT_DROWSY, WEIGHT_YAWN, WEIGHT_FACE_FAIL)
+_DECAY_RATE = math.log(2) / (SCORE_HALF_LIFE_H * 3600.0)
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _seconds(ts) -> float:
+    return (ts - _EPOCH).total_seconds() if isinstance(ts, datetime) else float(ts)
+
+
+class DecayedCounters:
+    """drowsy / yawn / face-fail counts, each decaying exponentially since t."""
+
+    __slots__ = ("values", "t")
+
+    def __init__(self, values=(0.0, 0.0, 0.0), t: float = 0.0):
+        self.values = list(values)
+        self.t = t
+
+    def decayed(self, now: float) -> List[float]:
+        if now <= self.t:
+            return list(self.values)
+        factor = math.exp(-_DECAY_RATE * (now - self.t))
+        return [v * factor for v in self.values]
+
+    def add(self, slot: int, at: float):
+        if at >= self.t:
+            self.values = self.decayed(at)
+            self.t = at
+            self.values[slot] += 1.0
+        else:
+            # Late event: add its contribution already decayed to our reference time
+            self.values[slot] += math.exp(-_DECAY_RATE * (self.t - at))
+
+    def score(self, now: Optional[float] = None) -> float:
+        values = self.decayed(now if now is not None else time.time())
+        penalty = sum(w * v for w, v in zip(WEIGHTS, values))
+        return round(max(0.0, min(100.0, 100.0 - penalty)), 2)
+
+
+class ScoreEngine:
+    """
+    Per-driver decayed counters, stored in driver_scores so every worker
+    shares them. Each ingested alert updates its driver's counters in O(1)
+    inside the insert transaction (a batch hook); the logs table is only
+    replayed for a driver that has no stored counters yet (cold start) and
+    by recompute_all. After commit, scores of the drivers in the batch are
+    persisted when their shown (rounded) value changed, so decay recovery
+    reaches drivers.score whenever a driver sends data.
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self._lock = threading.Lock()
+        self.events = 0
+        self.cold_starts = 0
+        self.persisted = 0
+
+    def apply(self, db: Session, rows: List[dict]):
+        """Batch hook: fold the batch's alert events into the stored counters."""
+        events: Dict[int, List[tuple]] = {}
+        for row in rows:
+            slot = EVENT_KINDS.get(row.get("event_type"))
+            driver_id = row.get("driver_id")
+            if slot is None or driver_id is None:
+                continue
+            events.setdefault(driver_id, []).append((slot, _seconds(row.get("timestamp") or datetime.utcnow())))
+        if not events:
+            return
+        ids = sorted(events)
+        # Row locks on PostgreSQL; on SQLite this transaction already holds the write lock
+        counters = _read_counters(db, ids, for_update=True)
+        missing = [d for d in ids if d not in counters]
+        if missing:
+            # The replay sees this batch's rows too (same transaction), so they are not added again
+            rebuilt = _load_counters(db.connection(), missing, datetime.utcnow() - timedelta(hours=SCORE_WINDOW_H))
+            counters.update({d: rebuilt.get(d) or DecayedCounters() for d in missing})
+        for driver_id, batch in events.items():
+            if driver_id not in missing:
+                for slot, at in batch:
+                    counters[driver_id].add(slot, at)
+        _store(db, counters)
+        with self._lock:
+            self.events += sum(len(batch) for batch in events.values())
+            self.cold_starts += len(missing)
+
+    def on_ingest(self, rows: List[dict], ids: List[int]):
+        touched = {row["driver_id"] for row in rows if row.get("driver_id") is not None}
+        if touched:
+            self.persist(touched)
+
+    def persist(self, driver_ids: Iterable[int], force: bool = False):
+        """Write the current scores of drivers with stored counters whose shown score changed."""
+        with self.session_factory() as db:
+            counters = _read_counters(db, sorted(set(driver_ids)))
+        now = time.time()
+        scores = {}
+        for driver_id, c in counters.items():
+            driver = drivers.registry.get(driver_id)
+            if driver is None:
+                continue
+            score = c.score(now)
+            # The registry keeps whole points, so decay is written once per point at most
+            if force or driver.get("score") != int(round(score)):
+                scores[driver_id] = {"score": score}
+        if not scores:
+            return
+        drivers.registry.update_live(scores)
+        with self._lock:
+            self.persisted += len(scores)
+        live.broker.publish([{"type": "score", "driver_id": d, **fields} for d, fields in scores.items()])
+
+    def breakdown(self, driver_id: int) -> dict:
+        with self.session_factory() as db:
+            counters = _read_counters(db, [driver_id]).get(driver_id) or DecayedCounters()
+        now = time.time()
+        drowsy, yawn, face = counters.decayed(now)
+        return {
+            "driver_id": driver_id,
+            "score": counters.score(now),
+            "drowsy": round(drowsy, 4),
+            "yawn": round(yawn, 4),
+            "face_fail": round(face, 4),
+            "half_life_h": SCORE_HALF_LIFE_H,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"events": self.events, "cold_starts": self.cold_starts, "persisted": self.persisted}
+
+
+def _read_counters(db: Session, driver_ids: List[int], for_update: bool = False) -> Dict[int, DecayedCounters]:
+    t = DriverScore.__table__.c
+    stmt = select(t.driver_id, t.drowsy, t.yawn, t.face_fail, t.updated_at).where(t.driver_id.in_(driver_ids))
+    if for_update:
+        stmt = stmt.with_for_update()
+    return {d: DecayedCounters((drowsy, yawn, face), at) for d, drowsy, yawn, face, at in db.execute(stmt)}
+
+
+def _store(db: Session, counters: Dict[int, DecayedCounters]):
+    if not counters:
+        return
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    stmt = insert(DriverScore)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["driver_id"], set_={c: stmt.excluded[c] for c in ("drowsy", "yawn", "face_fail", "updated_at")}
+    )
+    db.execute(stmt, [
+        {"driver_id": d, "drowsy": c.values[0], "yawn": c.values[1], "face_fail": c.values[2], "updated_at": c.t}
+        for d, c in counters.items()
+    ])
+
+
+# --- batch recompute ---
+
+def _load_counters(conn, driver_ids: Optional[List[int]] = None,
+                   since: Optional[datetime] = None) -> Dict[int, DecayedCounters]:
+    """Replay alert events from the logs table (served by ix_logs_event_timestamp_id)."""
+    stmt = select(LogEntry.driver_id, LogEntry.event_type, LogEntry.timestamp).where(
+        LogEntry.event_type.in_(list(EVENT_KINDS)), LogEntry.driver_id.isnot(None))
+    if driver_ids is not None:
+        stmt = stmt.where(LogEntry.driver_id.in_(driver_ids))
+    if since is not None:
+        stmt = stmt.where(LogEntry.timestamp >= since)
+    result: Dict[int, DecayedCounters] = {}
+    for driver_id, event_type, ts in conn.execute(stmt.order_by(LogEntry.timestamp).execution_options(yield_per=5000)):
+        counters = result.get(driver_id)
+        if counters is None:
+            counters = result[driver_id] = DecayedCounters()
+        counters.add(EVENT_KINDS[event_type], _seconds(ts))
+    return result
+
+
+def _replay(driver_ids: List[int], url: Optional[str] = None) -> Dict[int, tuple]:
+    """Worker: rebuild counters for a slice of drivers from the logs table."""
+    # Own engine per worker process; pooled connections must not cross a fork
+    engine = make_engine(url or DATABASE_URL)
+    try:
+        with engine.connect() as conn:
+            result = _load_counters(conn, driver_ids)
+    finally:
+        engine.dispose()
+    return {d: (c.values, c.t) for d, c in result.items()}
+
+
+def recompute_all(workers: Optional[int] = None, chunk_size: int = 200) -> int:
+    """
+    Rebuild every driver's counters from logs, partitioned by driver across
+    CPU cores, then store them and persist the scores. Run after changing
+    the scoring formula.
+    """
+    with SessionLocal() as db:
+        ids = set(db.scalars(select(DriverProfile.id)))
+        ids.update(d for d in db.scalars(
+            select(LogEntry.driver_id).where(LogEntry.event_type.in_(list(EVENT_KINDS))).distinct()
+        ) if d is not None)
+    ids = sorted(ids)
+    chunks = [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+    counters: Dict[int, DecayedCounters] = {d: DecayedCounters() for d in ids}
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(chunks) <= 1:
+        parts = [_replay(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            parts = list(pool.map(_replay, chunks))
+    for part in parts:
+        for driver_id, (values, t) in part.items():
+            counters[driver_id] = DecayedCounters(values, t)
+    with SessionLocal() as db:
+        _store(db, counters)
+        db.commit()
+    score_engine.persist(ids, force=True)
+    return len(ids)
+
+
+score_engine = ScoreEngine()
+telemetry.add_batch_hook(score_engine.apply)
+telemetry.add_listener(score_engine.on_ingest)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Driver safety scores")
+    parser.add_argument("--recompute", action="store_true", help="rebuild all scores from the logs table")
+    parser.add_argument("--workers", type=int, default=None, help="processes to use (default: CPU count)")
+    args = parser.parse_args()
+    if args.recompute:
+        started = time.perf_counter()
+        count = recompute_all(args.workers)
+        print(f"Recomputed scores for {count} drivers in {time.perf_counter() - started:.2f}s")
+    else:
+        parser.print_help()
@@ -0,0 +1,259 @@
+# telemetry.py
+import json
+import math
+import os
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from models import LogEntry, LogEventIn
+
+# Max events accepted in one request, and rows per INSERT statement / transaction
+MAX_BATCH_EVENTS = int(os.environ.get("INGEST_MAX_BATCH", "10000"))
+INSERT_CHUNK_SIZE = int(os.environ.get("INGEST_CHUNK_SIZE", "500"))
+
+# Numeric data fields that are also stored in typed LogEntry columns
+TYPED_FIELDS = ("ear", "mar", "speed", "confidence")
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+# Binary batches, decoded by wire.py (numpy, so only imported when one arrives)
+WIRE_CONTENT_TYPE = "application/x-telemetry-batch"
+
+# Called with (rows, ids) after every committed batch; see add_listener()
+_listeners: List[Callable[[List[dict], List[int]], None]] = []
+# Called with (db, rows) inside the insert transaction, before commit; see add_batch_hook()
+_batch_hooks: List[Callable[[Session, List[dict]], None]] = []
+
+
+def add_batch_hook(fn: Callable[[Session, List[dict]], None]):
+    if fn not in _batch_hooks:
+        _batch_hooks.append(fn)
+
+
+def add_listener(fn: Callable[[List[dict], List[int]], None]):
+    if fn not in _listeners:
+        _listeners.append(fn)
+
+
+def remove_listener(fn: Callable[[List[dict], List[int]], None]):
+    if fn in _listeners:
+        _listeners.remove(fn)
+
+
+def notify(rows: List[dict], ids: List[int]):
+    for fn in list(_listeners):
+        try:
+            fn(rows, ids)
+        except Exception as e:
+            print(f"Ingest Listener Error ({getattr(fn, '__name__', fn)}): {e}")
+
+
+def is_ndjson(content_type: Optional[str]) -> bool:
+    if not content_type:
+        return False
+    return content_type.split(";")[0].strip().lower() in NDJSON_CONTENT_TYPES
+
+
+def is_wire(content_type: Optional[str]) -> bool:
+    if not content_type:
+        return False
+    return content_type.split(";")[0].strip().lower() == WIRE_CONTENT_TYPE
+
+
+def encode_data(data: Any) -> str:
+    if data is None:
+        return "{}"
+    if isinstance(data, str):
+        return data
+    return json.dumps(data, separators=(",", ":"))
+
+
+def decode_data(data: Optional[str]) -> dict:
+    if not data:
+        return {}
+    try:
+        value = json.loads(data)
+    except ValueError:
+        return {}
+    return value if isinstance(value, dict) else {}
+
+
+def typed_fields(data: dict) -> dict:
+    """Typed column values for a decoded data dict; None where absent or not a finite number."""
+    out = {}
+    for name in TYPED_FIELDS:
+        value = data.get(name)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            value = None
+        out[name] = None if value is None else float(value)
+    return out
+
+
+def to_utc_naive(value: datetime) -> datetime:
+    # Timestamps are stored as naive UTC, like datetime.utcnow() elsewhere
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def validate_event(item: Any) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    Validate one raw event. Returns (row, None) ready for LogEntry insert,
+    or (None, error message).
+    """
+    if not isinstance(item, dict):
+        return None, "Event must be a JSON object"
+    try:
+        event = LogEventIn(**item)
+    except ValidationError as e:
+        err = e.errors()[0]
+        loc = ".".join(str(p) for p in err.get("loc", ()))
+        return None, f"{loc}: {err.get('msg')}" if loc else err.get("msg")
+    data = event.data if isinstance(event.data, dict) else decode_data(event.data)
+    row = {
+        "driver_id": event.driver_id,
+        "event_type": event.event_type,
+        "data": encode_data(event.data),
+        "timestamp": to_utc_naive(event.timestamp) if event.timestamp else datetime.utcnow(),
+        **typed_fields(data),
+    }
+    return row, None
+
+
+def insert_log_batch(db: Session, rows: List[dict]) -> List[int]:
+    """
+    Insert rows with a single executemany INSERT and commit once, then
+    notify ingest listeners. Batch hooks (e.g. rollups) run in the same
+    transaction. Returns the new log ids in the same order as rows.
+    """
+    if not rows:
+        return []
+    for row in rows:
+        # Rows built elsewhere (writer, detector) may only carry the data blob
+        if TYPED_FIELDS[0] not in row:
+            row.update(typed_fields(decode_data(row.get("data"))))
+    table = LogEntry.__table__
+    try:
+        if db.get_bind().dialect.name == "sqlite":
+            # sort_by_parameter_order makes SQLite fall back to one INSERT per
+            # row (it has no sentinel SQLAlchemy can order RETURNING by). A
+            # plain multi-row VALUES insert gets the ids back in arbitrary
+            # order, but SQLite hands out INTEGER PRIMARY KEY rowids as
+            # max(rowid) + 1 in VALUES order under the write lock we hold, so
+            # sorting them lines them back up with rows.
+            ids = sorted(db.scalars(insert(table).returning(table.c.id), rows))
+        else:
+            # Batched and ordered via the sequence/identity sentinel
+            ids = list(db.scalars(insert(table).returning(table.c.id, sort_by_parameter_order=True), rows))
+        for hook in _batch_hooks:
+            hook(db, rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    notify(rows, ids)
+    return ids
+
+
+def iter_json_array(body: bytes) -> Iterator[Tuple[Any, Optional[str]]]:
+    payload = json.loads(body)
+    if isinstance(payload, dict):
+        payload = payload.get("events", [payload])
+    if not isinstance(payload, list):
+        raise ValueError("Expected a JSON array of events")
+    for item in payload:
+        yield item, None
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[Any, Optional[str]]]:
+    # Parse line by line as the body streams in, so large uploads are never held whole
+    buf = b""
+    async for chunk in chunks:
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_line(line)
+    if buf.strip():
+        yield _parse_line(buf)
+
+
+def _parse_line(line: bytes) -> Tuple[Any, Optional[str]]:
+    try:
+        return json.loads(line), None
+    except ValueError as e:
+        return None, f"Invalid JSON: {e}"
+
+
+class BatchIngest:
+    """
+    Collects validated events and flushes them in INSERT_CHUNK_SIZE batches,
+    keeping a per-item result list in request order. Past MAX_BATCH_EVENTS
+    it records one error entry and sets `truncated`; callers stop reading
+    the request there.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.results: List[dict] = []
+        self.pending: List[Tuple[int, dict]] = []
+        self.accepted = 0
+        self.rejected = 0
+        self.truncated = False
+
+    def add(self, item: Any, parse_error: Optional[str] = None) -> bool:
+        if self.truncated or len(self.results) >= MAX_BATCH_EVENTS:
+            return self._overflow()
+        if parse_error:
+            return self.add_row(None, parse_error)
+        return self.add_row(*validate_event(item))
+
+    def add_row(self, row: Optional[dict], error: Optional[str] = None) -> bool:
+        """Add an already validated row (or its error), e.g. from a binary batch."""
+        index = len(self.results)
+        if self.truncated or index >= MAX_BATCH_EVENTS:
+            return self._overflow()
+        if error:
+            self.results.append({"index": index, "ok": False, "error": error})
+            self.rejected += 1
+        else:
+            self.results.append({"index": index, "ok": True})
+            self.pending.append((index, row))
+        return len(self.pending) >= INSERT_CHUNK_SIZE
+
+    def _overflow(self) -> bool:
+        # A single entry stands for every event past the limit, so an endless stream can't grow results
+        if not self.truncated:
+            self.truncated = True
+            self.results.append({"index": len(self.results), "ok": False,
+                                 "error": f"Batch limit of {MAX_BATCH_EVENTS} events exceeded; the rest was not read"})
+            self.rejected += 1
+        return False
+
+    def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        try:
+            ids = insert_log_batch(self.db, [row for _, row in pending])
+        except Exception as e:
+            print(f"Batch Ingest Error: {e}")
+            for index, _ in pending:
+                self.results[index] = {"index": index, "ok": False, "error": "Database error"}
+            self.rejected += len(pending)
+            return
+        for (index, _), log_id in zip(pending, ids):
+            self.results[index]["log_id"] = log_id
+        self.accepted += len(pending)
+
+    def summary(self) -> dict:
+        return {
+            "ok": self.rejected == 0,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "truncated": self.truncated,
+            "results": self.results,
+        }
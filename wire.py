@@ -0,0 +1,207 @@
+# wire.py
+# Compact binary framing for telemetry batches sent by edge devices.
+#
+#   header   <4sBBHI   magic b"DMTB", version, flags (reserved, 0), type count, record count
+#   types    type count x (u8 length, UTF-8 event type name)
+#   records  record count x RECORD_DTYPE (36 bytes, little-endian, packed)
+#   extras   concatenated UTF-8 JSON objects, record i owning extra_len[i] bytes
+#
+# Records reference event types by index into the type table. Metric fields
+# are float32 with NaN meaning "not present"; the timestamp is microseconds
+# since the Unix epoch (UTC) and only used when flag bit 0 is set.
+import json
+import struct
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from telemetry import WIRE_CONTENT_TYPE as CONTENT_TYPE, is_wire  # noqa: F401
+
+MAGIC = b"DMTB"
+VERSION = 1
+FLAG_TIMESTAMP = 0x1
+
+HEADER = struct.Struct("<4sBBHI")
+RECORD_DTYPE = np.dtype([
+    ("driver_id", "<u4"),
+    ("event_type", "<u2"),
+    ("flags", "<u2"),
+    ("timestamp", "<i8"),
+    ("ear", "<f4"),
+    ("mar", "<f4"),
+    ("speed", "<f4"),
+    ("confidence", "<f4"),
+    ("extra_len", "<u4"),
+])
+METRICS = ("ear", "mar", "speed", "confidence")
+# Metric values are float32 on the wire; round away the float32 noise on decode
+METRIC_DECIMALS = 5
+MAX_EVENT_TYPE_LEN = 64
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class WireError(ValueError):
+    pass
+
+
+class WireBatch:
+    """A decoded batch: the record array is a zero-copy view of the request body."""
+
+    def __init__(self, types: List[str], records: np.ndarray, extras: memoryview, extra_offsets: np.ndarray):
+        self.types = types
+        self.records = records
+        self.extras = extras
+        self.extra_offsets = extra_offsets
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def rows(self) -> List[Tuple[Optional[dict], Optional[str]]]:
+        """(row, error) per record, rows shaped like telemetry.validate_event output."""
+        rec = self.records
+        n = len(rec)
+        now = datetime.utcnow()
+        driver_ids = rec["driver_id"].tolist()
+        type_idx = rec["event_type"].tolist()
+        has_ts = (rec["flags"] & FLAG_TIMESTAMP).astype(bool)
+        stamps = rec["timestamp"].astype("datetime64[us]").tolist()
+        # Metric fragments ('"ear":0.21') are formatted column by column; a
+        # record's data JSON is then a join, with no per-record dict or dumps
+        fragments: List[List[str]] = [[] for _ in range(n)]
+        columns = []
+        for m in METRICS:
+            col = rec[m].astype(np.float64)
+            present = np.isfinite(col)
+            if not present.any():
+                continue
+            prefix = f'"{m}":'
+            values = np.round(col, METRIC_DECIMALS).tolist()
+            for i in np.flatnonzero(present).tolist():
+                fragments[i].append(prefix + repr(values[i]))
+            columns.append((m, values, present.tolist()))
+        lengths = rec["extra_len"].tolist()
+        offsets = self.extra_offsets.tolist()
+        has_ts = has_ts.tolist()
+
+        typed = dict.fromkeys(METRICS)
+        out: List[Tuple[Optional[dict], Optional[str]]] = []
+        for i in range(n):
+            t = type_idx[i]
+            if t >= len(self.types):
+                out.append((None, f"event_type index {t} out of range"))
+                continue
+            stamp = stamps[i] if has_ts[i] else now
+            if not isinstance(stamp, datetime):
+                out.append((None, "timestamp out of range"))
+                continue
+            if lengths[i]:
+                try:
+                    extra = json.loads(bytes(self.extras[offsets[i]:offsets[i] + lengths[i]]))
+                except ValueError as e:
+                    out.append((None, f"Invalid extra JSON: {e}"))
+                    continue
+                if not isinstance(extra, dict):
+                    out.append((None, "Extra data must be a JSON object"))
+                    continue
+                for m, values, present in columns:
+                    if present[i]:
+                        extra[m] = values[i]
+                data = json.dumps(extra, separators=(",", ":"))
+            else:
+                data = "{" + ",".join(fragments[i]) + "}"
+            row = {
+                "driver_id": driver_ids[i],
+                "event_type": self.types[t],
+                "data": data,
+                "timestamp": stamp,
+                **typed,
+            }
+            for m, values, present in columns:
+                if present[i]:
+                    row[m] = values[i]
+            out.append((row, None))
+        return out
+
+
+def decode(body: bytes) -> WireBatch:
+    view = memoryview(body)
+    if len(view) < HEADER.size:
+        raise WireError("Truncated header")
+    magic, version, _flags, type_count, count = HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise WireError("Bad magic")
+    if version != VERSION:
+        raise WireError(f"Unsupported wire version {version}")
+    pos = HEADER.size
+    types: List[str] = []
+    for _ in range(type_count):
+        if pos >= len(view):
+            raise WireError("Truncated type table")
+        length = view[pos]
+        name = bytes(view[pos + 1:pos + 1 + length])
+        if len(name) != length:
+            raise WireError("Truncated type table")
+        if not 1 <= length <= MAX_EVENT_TYPE_LEN:
+            raise WireError(f"Event type length must be 1..{MAX_EVENT_TYPE_LEN}")
+        try:
+            types.append(name.decode("utf-8"))
+        except UnicodeDecodeError:
+            raise WireError("Event type is not valid UTF-8")
+        pos += 1 + length
+    end = pos + count * RECORD_DTYPE.itemsize
+    if end > len(view):
+        raise WireError("Truncated records")
+    records = np.frombuffer(body, dtype=RECORD_DTYPE, count=count, offset=pos)
+    lengths = records["extra_len"].astype(np.int64)
+    offsets = np.zeros(count, dtype=np.int64)
+    if count:
+        np.cumsum(lengths[:-1], out=offsets[1:])
+    if end + int(lengths.sum()) != len(view):
+        raise WireError("Extras length does not match body size")
+    return WireBatch(types, records, view[end:], offsets)
+
+
+def _epoch_us(ts) -> int:
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    # Naive timestamps are UTC, as everywhere else in the backend
+    seconds = ts.timestamp() if ts.tzinfo is not None else (ts - _EPOCH).total_seconds()
+    return int(round(seconds * 1_000_000))
+
+
+def encode(events: Iterable[dict]) -> bytes:
+    """
+    Encode events ({driver_id, event_type, timestamp?, data?}) into a batch.
+    Numeric metric keys in data go to their fixed fields, anything else to
+    extras. Used by device clients and the benchmark.
+    """
+    events = list(events)
+    n = len(events)
+    types: dict = {}
+    cols = {name: [] for name in ("driver_id", "event_type", "flags", "timestamp", "extra_len")}
+    metrics = {m: [] for m in METRICS}
+    extras: List[bytes] = []
+    for ev in events:
+        cols["driver_id"].append(ev["driver_id"])
+        cols["event_type"].append(types.setdefault(ev["event_type"], len(types)))
+        ts = ev.get("timestamp")
+        cols["flags"].append(FLAG_TIMESTAMP if ts is not None else 0)
+        cols["timestamp"].append(_epoch_us(ts) if ts is not None else 0)
+        data = dict(ev.get("data") or {})
+        for m in METRICS:
+            value = data.get(m)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                metrics[m].append(data.pop(m))
+            else:
+                metrics[m].append(np.nan)
+        extra = json.dumps(data, separators=(",", ":")).encode() if data else b""
+        cols["extra_len"].append(len(extra))
+        extras.append(extra)
+    records = np.empty(n, dtype=RECORD_DTYPE)
+    for name, values in {**cols, **metrics}.items():
+        records[name] = values
+    table = b"".join(bytes([len(name.encode())]) + name.encode() for name in types)
+    header = HEADER.pack(MAGIC, VERSION, 0, len(types), n)
+    return header + table + records.tobytes() + b"".join(extras)